@@ -0,0 +1,277 @@
+"""API and DB-layer benchmarks on a scratch database.
+
+Everything runs in-process and offline: DB_DIR and POSTS_DIR point at a
+temporary directory, N posts are seeded through `create_post`, then
+
+- each API route is driven through the WSGI app by `--concurrency` threads
+  (GET /api/posts, /api/posts/<id>, /media/posts/<file>, login, signup), and
+- each db_logic_* function is timed on its own,
+
+reporting throughput and latency percentiles. Results can be saved as JSON
+and compared with an earlier run; the exit status is 1 when something got
+slower than `--threshold` so CI can flag regressions.
+
+    python bench/bench_api.py [--posts 500] [--concurrency 8] [--seconds 3]
+                              [--only api|db] [--json] [--output run.json]
+                              [--compare baseline.json] [--threshold 0.2]
+"""
+import argparse
+import base64
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+PNG_1X1 = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
+)
+MDX = "# Benchmark post {n}\n\nSome *emphasis*, a [link](https://example.com) and `code`.\n\n" + \
+      "\n".join(f"- item {i} with a few words of text" for i in range(20))
+PASSWORD = "correct horse battery staple"
+
+
+def _summary(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    latencies = sorted(latencies)
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+    return {
+        'ops': len(latencies),
+        'errors': errors,
+        'ops_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
+
+
+def _timed(fn: Callable[[int], object], seconds: float, concurrency: int = 1,
+           max_ops: int = 0) -> Dict[str, float]:
+    """Call fn(i) from `concurrency` threads until `seconds` pass (or
+    `max_ops` calls were made); fn returns False/raises to count an error."""
+    deadline = time.perf_counter() + seconds
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker() -> None:
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            i = next(counter)
+            if max_ops and i >= max_ops:
+                break
+            start = time.perf_counter()
+            try:
+                ok = fn(i)
+            except Exception:
+                ok = False
+            local.append(time.perf_counter() - start)
+            if ok is False:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return _summary(latencies, time.perf_counter() - start, errors[0])
+
+
+def _post_content(n: int) -> Dict:
+    return {'mdx': MDX.format(n=n), 'thumbnail_bytes': PNG_1X1, 'thumbnail_ext': '.png',
+            'author': f'author{n % 10}', 'created_at': f'2024-01-01T00:{n // 60 % 60:02d}:{n % 60:02d}'}
+
+
+def _drain_jobs(jobs, timeout: float = 120.0) -> None:
+    # Let background rendering finish so it doesn't skew the measurements
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = jobs.job_stats()
+        if not stats['queued'] and not stats['running']:
+            return
+        time.sleep(0.1)
+
+
+def bench_api(args, app_module, post_ids: List[int], media_path: str) -> Dict[str, Dict]:
+    app = app_module.app
+    clients = threading.local()
+
+    def client():
+        if not hasattr(clients, 'c'):
+            clients.c = app.test_client()
+        return clients.c
+
+    def get(path: str) -> Callable[[int], bool]:
+        return lambda i: client().get(path).status_code < 400
+
+    client().post('/api/auth/signup', json={'name': 'bench', 'email': 'bench@example.com', 'password': PASSWORD})
+    run = f"{os.getpid()}-{int(time.time())}"
+    routes = {
+        'GET /api/posts': get('/api/posts'),
+        'GET /api/posts?limit=20': get('/api/posts?limit=20'),
+        'GET /api/posts/<id>': lambda i: client().get(f'/api/posts/{post_ids[i % len(post_ids)]}').status_code < 400,
+        'GET /media/posts/<file>': get(media_path),
+        'POST /api/auth/login': lambda i: client().post(
+            '/api/auth/login', json={'email': 'bench@example.com', 'password': PASSWORD}).status_code < 400,
+        'POST /api/auth/signup': lambda i: client().post(
+            '/api/auth/signup',
+            json={'name': 'b', 'email': f'bench-{run}-{i}@example.com', 'password': PASSWORD}).status_code < 400,
+    }
+    results = {}
+    for name, fn in routes.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = _timed(fn, args.seconds, args.concurrency)
+        _progress(name, results[name])
+    return results
+
+
+def bench_db(args, post_ids: List[int]) -> Dict[str, Dict]:
+    import db_logic_posts as posts
+    import db_logic_users as users
+
+    user_id = users.get_user_by_email('bench@example.com')
+    user_id = user_id['id'] if user_id else users.add_user('bench', 'bench@example.com', PASSWORD)
+    n = len(post_ids)
+    # Throwaway posts for the destructive calls, so reads see a stable table
+    doomed = posts.create_posts_bulk([dict(_post_content(i), title=f'doomed {i}') for i in range(200)])
+    run = f"{os.getpid()}-{int(time.time())}"
+    calls = {
+        'db_logic_posts.create_post': lambda i: posts.create_post(f'micro {i}', _post_content(i)),
+        'db_logic_posts.create_posts_bulk[50]': lambda i: posts.create_posts_bulk(
+            [dict(_post_content(j), title=f'bulk {i}-{j}') for j in range(50)]),
+        'db_logic_posts.get_posts': lambda i: posts.get_posts(),
+        'db_logic_posts.iter_posts': lambda i: sum(1 for _ in posts.iter_posts()),
+        'db_logic_posts.get_posts_page[20]': lambda i: posts.get_posts_page(20),
+        'db_logic_posts.get_post': lambda i: posts.get_post(post_ids[i % n]),
+        'db_logic_posts.update_post': lambda i: posts.update_post(
+            post_ids[i % n], f'Benchmark post {i % n}', {'mdx': MDX.format(n=i)}),
+        'db_logic_posts.search_posts': lambda i: posts.search_posts('benchmark emphasis', 20),
+        'db_logic_posts.delete_post': lambda i: posts.delete_post(doomed[i]),
+        'db_logic_users.check_user_exists': lambda i: users.check_user_exists('bench@example.com'),
+        'db_logic_users.get_user': lambda i: users.get_user(user_id),
+        'db_logic_users.get_user_by_email': lambda i: users.get_user_by_email('bench@example.com'),
+        'db_logic_users.add_user': lambda i: users.add_user('b', f'micro-{run}-{i}@example.com', PASSWORD),
+        'db_logic_users.verify_credentials': lambda i: users.verify_credentials('bench@example.com', PASSWORD),
+    }
+    limits = {'db_logic_posts.delete_post': len(doomed)}
+    results = {}
+    for name, fn in calls.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = _timed(fn, args.seconds, 1, limits.get(name, 0))
+        _progress(name, results[name])
+    return results
+
+
+def _progress(name: str, r: Dict) -> None:
+    print(f"  {name:<40} {r['ops_per_sec']:10.1f} ops/s  p50 {r['p50_ms']:8.3f} ms  "
+          f"p95 {r['p95_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  ({r['errors']} errors)", file=sys.stderr)
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Names whose throughput dropped by more than `threshold` (a fraction)."""
+    regressions = []
+    for section in ('api', 'db'):
+        for name, r in current.get(section, {}).items():
+            base = baseline.get(section, {}).get(name)
+            if not base or not base.get('ops_per_sec'):
+                continue
+            change = r['ops_per_sec'] / base['ops_per_sec'] - 1
+            line = f"{name}: {base['ops_per_sec']} -> {r['ops_per_sec']} ops/s ({change:+.1%})"
+            print(('REGRESSION ' if change < -threshold else '  ') + line, file=sys.stderr)
+            if change < -threshold:
+                regressions.append(name)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=500, help='posts to seed through create_post')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads driving each API route')
+    parser.add_argument('--seconds', type=float, default=3.0, help='time spent on each benchmark')
+    parser.add_argument('--only', choices=('api', 'db'), help='run only one group')
+    parser.add_argument('--filter', help='only benchmarks whose name contains this text')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--compare', help='baseline JSON file from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed throughput drop vs the baseline (default 0.2 = 20%%)')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-')
+    # Must be set before the app modules are imported
+    os.environ['DB_DIR'] = os.path.join(scratch, 'db')
+    os.environ['POSTS_DIR'] = os.path.join(scratch, 'posts')
+    # Every request comes from one address; limits would only measure 429s
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    sys.path.insert(0, CODE_DIR)
+    try:
+        import app as app_module
+        import db_logic_posts
+        import jobs
+        import post_storage
+
+        app_module.init_db()
+        jobs.start()
+        print(f"Seeding {args.posts} posts in {scratch}", file=sys.stderr)
+        start = time.perf_counter()
+        post_ids = [db_logic_posts.create_post(f'Benchmark post {i}', _post_content(i)) for i in range(args.posts)]
+        seed_seconds = time.perf_counter() - start
+        _drain_jobs(jobs)
+        media_path = '/media/posts/' + post_storage.media_name(db_logic_posts.get_post(post_ids[0])[1])
+
+        results: Dict[str, object] = {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'posts': args.posts,
+                'concurrency': args.concurrency,
+                'seconds': args.seconds,
+                'seed_posts_per_sec': round(args.posts / seed_seconds, 1) if seed_seconds else 0.0,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+        }
+        if args.only in (None, 'api'):
+            print("API (in-process WSGI):", file=sys.stderr)
+            results['api'] = bench_api(args, app_module, post_ids, media_path)
+        if args.only in (None, 'db'):
+            print("DB layer:", file=sys.stderr)
+            results['db'] = bench_db(args, post_ids)
+        jobs.shutdown()
+    finally:
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
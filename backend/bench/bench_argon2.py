@@ -0,0 +1,70 @@
+"""Argon2 throughput for a few parameter sets.
+
+Reports hashes per second (single thread and with N threads) so the
+ARGON2_* settings in .env can be chosen for the target hardware.
+
+    python bench/bench_argon2.py [--threads 4] [--seconds 3] [--json]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from argon2 import PasswordHasher  # type: ignore
+
+# (label, time_cost, memory_cost KiB, parallelism)
+PARAMETER_SETS = [
+    ("low", 1, 19456, 1),
+    ("owasp", 2, 19456, 1),
+    ("default", 3, 65536, 4),
+    ("high", 4, 131072, 4),
+]
+
+
+def _measure(ph: PasswordHasher, threads: int, seconds: float) -> float:
+    deadline = time.perf_counter() + seconds
+
+    def worker() -> int:
+        n = 0
+        while time.perf_counter() < deadline:
+            ph.hash("correct horse battery staple")
+            n += 1
+        return n
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(lambda _: worker(), range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for label, t, m, p in PARAMETER_SETS:
+        ph = PasswordHasher(time_cost=t, memory_cost=m, parallelism=p)
+        results.append({
+            "params": label,
+            "time_cost": t,
+            "memory_cost": m,
+            "parallelism": p,
+            "hashes_per_sec_1_thread": round(_measure(ph, 1, args.seconds), 2),
+            f"hashes_per_sec_{args.threads}_threads": round(_measure(ph, args.threads, args.seconds), 2),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        values = [v for k, v in r.items() if k.startswith("hashes_per_sec")]
+        print(f"{r['params']:>8}  t={r['time_cost']} m={r['memory_cost']:>6}KiB p={r['parallelism']}  "
+              f"{values[0]:8.2f} h/s (1 thread)  {values[1]:8.2f} h/s ({args.threads} threads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Connection capacity of the sync (gunicorn gthread) vs ASGI (uvicorn) path.
+
+Starts each server with the same thread budget (one process, --threads T
+for gunicorn, ASGI_THREADS=T for uvicorn) on a scratch copy of code/, seeds
+some posts and a large media file, then opens S slow clients that download
+the file at a trickle while C fast clients request feed pages and single
+posts. Reports the fast clients' throughput, latency and errors for each
+number of slow clients: under the sync path every slow download holds a
+thread, so once S reaches T the feed stalls; under ASGI it should not.
+
+    python bench/bench_asgi.py [--servers gunicorn,asgi] [--threads 8]
+                               [--slow 0,8,32] [--connections 16]
+                               [--seconds 8] [--json]
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_serving import CODE_DIR, _request, _seed, _wait_ready  # noqa: E402
+
+FAST_PATHS = ('/api/posts?limit=20', '/api/posts/{post_id}')
+
+SERVERS = {
+    'gunicorn': lambda port, threads: [sys.executable, '-m', 'flask', '--app', 'app', 'serve',
+                                       '--bind', f'127.0.0.1:{port}', '--workers', '1', '--threads', str(threads)],
+    'asgi': lambda port, threads: [sys.executable, '-m', 'flask', '--app', 'app', 'serve-asgi',
+                                   '--bind', f'127.0.0.1:{port}', '--workers', '1'],
+}
+
+
+def _slow_client(port: int, path: str, stop: threading.Event) -> None:
+    """Download `path` over and over at ~16 KiB per 100 ms."""
+    while not stop.is_set():
+        sock = socket.socket()
+        # A small receive window keeps the server's writes blocked
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+        try:
+            sock.settimeout(30)
+            sock.connect(('127.0.0.1', port))
+            sock.sendall(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'.encode())
+            while not stop.is_set():
+                if not sock.recv(16 * 1024):
+                    break
+                stop.wait(0.1)
+        except OSError:
+            stop.wait(0.1)
+        finally:
+            sock.close()
+
+
+def _fast_load(port: int, connections: int, seconds: float, post_id: int) -> dict:
+    paths = [p.format(post_id=post_id) for p in FAST_PATHS]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset: int) -> None:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        local, failed, i = [], 0, offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = _request(conn, 'GET', paths[i % len(paths)])
+                if status >= 400:
+                    failed += 1
+                else:
+                    local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            i += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2) if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99),
+    }
+
+
+def run_server(name: str, args) -> list:
+    workdir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    code = os.path.join(workdir, 'code')
+    shutil.copytree(CODE_DIR, code, ignore=shutil.ignore_patterns('__pycache__'))
+    env = dict(os.environ, PYTHONPATH=code, GUNICORN_ACCESS_LOG='', FLASK_DEBUG='0', RATE_LIMIT_ENABLED='0',
+               ASGI_THREADS=str(args.threads), GUNICORN_TIMEOUT='120')
+    # Served from POSTS_DIR like any uploaded file
+    media_name = f'{uuid.uuid4()}.bin'
+    os.makedirs(os.path.join(workdir, 'posts'))
+    with open(os.path.join(workdir, 'posts', media_name), 'wb') as f:
+        f.write(os.urandom(args.media_mb * 1024 * 1024))
+    proc = subprocess.Popen(SERVERS[name](args.port, args.threads), cwd=code, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        _wait_ready(args.port)
+        post_id = _seed(args.port, args.posts)
+        for slow in (int(s) for s in args.slow.split(',') if s.strip()):
+            stop = threading.Event()
+            slow_threads = [threading.Thread(target=_slow_client, args=(args.port, '/media/posts/' + media_name, stop))
+                            for _ in range(slow)]
+            for t in slow_threads:
+                t.start()
+            time.sleep(1.0)  # let the downloads take their threads
+            result = _fast_load(args.port, args.connections, args.seconds, post_id)
+            stop.set()
+            for t in slow_threads:
+                t.join()
+            results.append(dict(server=name, threads=args.threads, slow_clients=slow, **result))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', default='gunicorn,asgi', help='comma-separated: gunicorn, asgi')
+    parser.add_argument('--threads', type=int, default=8, help='thread budget of each server')
+    parser.add_argument('--slow', default='0,8,32', help='comma-separated numbers of slow media downloads')
+    parser.add_argument('--connections', type=int, default=16, help='fast clients')
+    parser.add_argument('--seconds', type=float, default=8.0)
+    parser.add_argument('--posts', type=int, default=200, help='posts to seed before loading')
+    parser.add_argument('--media-mb', type=int, default=32, help='size of the slowly downloaded file')
+    parser.add_argument('--port', type=int, default=3098)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [r for name in args.servers.split(',') if name.strip() for r in run_server(name.strip(), args)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['server']:>9}  {r['slow_clients']:3d} slow  {r['requests_per_sec']:8.1f} req/s  "
+              f"p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:8.2f} ms  ({r['requests']} ok, {r['errors']} errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""GET /api/posts with serial vs parallel post file loading.
+
+Seeds N posts in a scratch directory, then times the full listing (and a
+paginated page) at each POST_IO_CONCURRENCY level. Local disks with a warm
+page cache hide the effect, so `--latency-ms` adds a delay to every post
+file access (read, exists, manifest load) to stand in for a network mount
+or a cold bind mount; pass 0 to measure the real disk.
+
+    python bench/bench_post_io.py [--posts 300] [--levels 1,4,8,16]
+                                  [--latency-ms 2] [--rounds 5] [--json]
+"""
+import argparse
+import base64
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+PNG_1X1 = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
+)
+PATHS = ('/api/posts', '/api/posts?view=summary&limit=100')
+
+
+def _add_latency(seconds: float) -> None:
+    import post_storage
+    import thumbnails
+
+    def slow(fn):
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    post_storage.FilesystemStorage.get = slow(post_storage.FilesystemStorage.get)
+    post_storage.FilesystemStorage.exists = slow(post_storage.FilesystemStorage.exists)
+    thumbnails.load_manifest = slow(thumbnails.load_manifest)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=300)
+    parser.add_argument('--levels', default='1,4,8,16', help='comma-separated POST_IO_CONCURRENCY values')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='delay added to each post file access')
+    parser.add_argument('--rounds', type=int, default=5, help='requests per path and level')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-io-')
+    # Must be set before the app modules are imported
+    os.environ['DB_DIR'] = os.path.join(scratch, 'db')
+    os.environ['POSTS_DIR'] = os.path.join(scratch, 'posts')
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['SLOW_REQUEST_MS'] = '1e9'
+    sys.path.insert(0, CODE_DIR)
+    results = []
+    try:
+        import app as app_module
+        import db_logic_posts
+
+        app_module.init_db()
+        db_logic_posts.create_posts_bulk([
+            {'title': f'IO post {i}', 'mdx': f'# Post {i}\n\n' + 'Some text for the excerpt. ' * 40,
+             'thumbnail_bytes': PNG_1X1, 'thumbnail_ext': '.png', 'author': 'bench'}
+            for i in range(args.posts)
+        ])
+        if args.latency_ms > 0:
+            _add_latency(args.latency_ms / 1000.0)
+        client = app_module.app.test_client()
+        for level in (int(x) for x in args.levels.split(',') if x.strip()):
+            app_module.POST_IO_CONCURRENCY = level
+            for path in PATHS:
+                client.get(path)  # warm up (pool threads, statement cache)
+                times = []
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    resp = client.get(path)
+                    times.append(time.perf_counter() - start)
+                    assert resp.status_code == 200, resp.status_code
+                results.append({'concurrency': level, 'path': path,
+                                'posts': len(resp.get_json()['posts']),
+                                'median_ms': round(statistics.median(times) * 1000, 1)})
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    serial = {r['path']: r['median_ms'] for r in results if r['concurrency'] == 1}
+    for r in results:
+        base = serial.get(r['path'])
+        speedup = f"  x{base / r['median_ms']:.1f}" if base and r['median_ms'] else ''
+        print(f"{r['path']:<36} concurrency {r['concurrency']:>3}  {r['median_ms']:9.1f} ms"
+              f"  ({r['posts']} posts){speedup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""HTTP throughput of the dev server vs gunicorn (`flask serve`).
+
+Starts each server on a scratch copy of code/ (so db/ and posts/ are
+temporary), seeds some posts, then keeps N keep-alive connections busy on a
+mix of read endpoints and reports requests/sec and latency percentiles.
+
+    python bench/bench_serving.py [--servers dev,gunicorn] [--connections 32]
+                                  [--seconds 10] [--posts 200] [--json]
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+
+# (weight, path) of the request mix: mostly feed pages and single posts
+PROFILE = [
+    (5, '/api/posts?limit=20'),
+    (3, '/api/posts/{post_id}'),
+    (1, '/api/posts/search?q=sample'),
+    (1, '/api/health'),
+]
+
+SERVERS = {
+    'dev': lambda port: [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port)],
+    'gunicorn': lambda port: [sys.executable, '-m', 'flask', '--app', 'app', 'serve',
+                              '--bind', f'127.0.0.1:{port}'],
+}
+
+
+def _request(conn: http.client.HTTPConnection, method: str, path: str, body=None):
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    return resp.status, data
+
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            if _request(conn, 'GET', '/api/health')[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def _seed(port: int, count: int) -> int:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    status, data = _request(conn, 'POST', '/api/posts/seed', {'count': count})
+    job_id = json.loads(data)['job_id']
+    while True:
+        job = json.loads(_request(conn, 'GET', f'/api/jobs/{job_id}')[1])
+        if job['status'] == 'done':
+            return job['result']['post_ids'][0]
+        if job['status'] == 'failed':
+            raise RuntimeError(f"seeding failed: {job['error']}")
+        time.sleep(0.2)
+
+
+def _load(port: int, connections: int, seconds: float, post_id: int) -> dict:
+    paths = [p.format(post_id=post_id) for w, p in PROFILE for _ in range(w)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset: int) -> None:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed, i = [], 0, offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = _request(conn, 'GET', paths[i % len(paths)])
+                if status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter() - start)
+            i += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2) if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': pct(0.50),
+        'p99_ms': pct(0.99),
+    }
+
+
+def run_server(name: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    code = os.path.join(workdir, 'code')
+    shutil.copytree(CODE_DIR, code, ignore=shutil.ignore_patterns('__pycache__'))
+    env = dict(os.environ, PYTHONPATH=code, GUNICORN_ACCESS_LOG='', FLASK_DEBUG='0',
+               RATE_LIMIT_ENABLED='0')
+    proc = subprocess.Popen(SERVERS[name](args.port), cwd=code, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(args.port)
+        post_id = _seed(args.port, args.posts)
+        result = _load(args.port, args.connections, args.seconds, post_id)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return dict(server=name, **result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', default='dev,gunicorn', help='comma-separated: dev, gunicorn')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--posts', type=int, default=200, help='posts to seed before loading')
+    parser.add_argument('--port', type=int, default=3099)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [run_server(name.strip(), args) for name in args.servers.split(',') if name.strip()]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['server']:>9}  {r['requests_per_sec']:8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+              f"p99 {r['p99_ms']:7.2f} ms  ({r['requests']} requests, {r['errors']} errors)")
+
+
+if __name__ == '__main__':
+    main()
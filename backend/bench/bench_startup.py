@@ -0,0 +1,96 @@
+"""Cold start: process spawn to first API response.
+
+Seeds a scratch database with N posts (so the schema is already current, as
+on a redeploy), then starts fresh Python processes that import the app, run
+app.init_db() and answer one feed request through the test client. Reports
+the median of each phase and of spawn-to-first-response.
+
+    python bench/bench_startup.py [--posts 2000] [--rounds 10] [--json]
+                                  [--code-dir ../other-checkout/backend/code]
+
+`--code-dir` runs the same measurement against another checkout of code/,
+e.g. to compare before and after a change.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+PNG_1X1_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
+
+SEED = '''
+import app, sys
+app.init_db()
+client = app.app.test_client()
+posts = [{"title": f"Startup post {i}", "content": "# Post\\n\\nSome text. " * 20,
+          "thumbnail_base64": sys.argv[2], "created_at": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00"}
+         for i in range(int(sys.argv[1]))]
+for start in range(0, len(posts), 500):
+    assert client.post("/api/posts/bulk", json={"posts": posts[start:start + 500]}).status_code == 201
+'''
+
+CHILD = '''
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.init_db()
+t2 = time.perf_counter()
+resp = app.app.test_client().get("/api/posts?limit=20")
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print("READY", flush=True)
+import json
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "init_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000}), flush=True)
+'''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=2000, help='posts in the database')
+    parser.add_argument('--rounds', type=int, default=10, help='cold starts to measure')
+    parser.add_argument('--code-dir', default=CODE_DIR, help='code/ directory to start (default: this checkout)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='blog-bench-startup-')
+    env = dict(os.environ, DB_DIR=os.path.join(scratch, 'db'), POSTS_DIR=os.path.join(scratch, 'posts'),
+               JOB_WORKERS='0', RATE_LIMIT_ENABLED='0', SLOW_REQUEST_MS='1e9')
+    code_dir = os.path.abspath(args.code_dir)
+    phases = {'import_ms': [], 'init_ms': [], 'first_request_ms': [], 'spawn_to_response_ms': []}
+    try:
+        subprocess.run([sys.executable, '-c', SEED, str(args.posts), PNG_1X1_B64], cwd=code_dir, env=env, check=True)
+        # One untimed start so .pyc files exist, as they would in an image
+        subprocess.run([sys.executable, '-c', CHILD], cwd=code_dir, env=env, check=True, capture_output=True)
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, '-c', CHILD], cwd=code_dir, env=env,
+                                    stdout=subprocess.PIPE, text=True)
+            ready = proc.stdout.readline()
+            phases['spawn_to_response_ms'].append((time.perf_counter() - start) * 1000)
+            assert ready.strip() == 'READY', ready
+            timings = json.loads(proc.stdout.readline())
+            proc.wait()
+            for name, value in timings.items():
+                phases[name].append(value)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {name: round(statistics.median(values), 1) for name, values in phases.items()}
+    if args.json:
+        print(json.dumps(dict(results, posts=args.posts, rounds=args.rounds, code_dir=code_dir), indent=2))
+        return
+    print(f"{args.posts} posts, median of {args.rounds} cold starts ({code_dir})")
+    for name, value in results.items():
+        print(f"  {name:<22} {value:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,84 @@
-import datetime
 import os
 from datetime import timedelta
-from flask import Flask, jsonify, request, send_from_directory, url_for, send_file # type: ignore
+from flask import ( # type: ignore
+	Flask, jsonify, request, send_from_directory, url_for, send_file, stream_with_context,
+	copy_current_request_context
+)
+from werkzeug.wsgi import wrap_file  # type: ignore
 import mimetypes
 from flask_cors import CORS  # type: ignore
 from flask_jwt_extended import ( # type: ignore
-	JWTManager, create_access_token, jwt_required, get_jwt_identity
+	JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 )  # type: ignore
 import base64
+import click
+import functools
 import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import zlib
+from io import BytesIO
 from dotenv import load_dotenv  # type: ignore
 
+# Before the local imports: they read their settings from the environment
+load_dotenv()  # load env vars from .env if present
+
 from db_logic_users import (
 	clear_users,
-	create_table,
 	add_user,
 	verify_credentials,
 	get_user as db_get_user,
+	get_user_cached,
+	user_cache,
+	update_user as db_update_user,
 	check_user_exists
 )
 
 from db_logic_posts import (
 	create_post as db_create_post,
+	create_posts_bulk as db_create_posts_bulk,
 	get_post as db_get_post,
 	get_posts as db_get_posts,
+	get_posts_page as db_get_posts_page,
+	normalize_timestamp,
+	get_changes as db_get_changes,
+	get_change_seq as db_get_change_seq,
+	prune_tombstones as db_prune_tombstones,
+	iter_posts as db_iter_posts,
 	update_post as db_update_post,
-	delete_post as db_delete_post
+	delete_post as db_delete_post,
+	delete_user_and_posts as db_delete_user_and_posts,
+	mark_author_changed as db_mark_author_changed,
+	store_placeholder as db_store_placeholder,
+	migrate_storage as db_migrate_storage,
+	search_posts as db_search_posts,
+	rebuild_search_index as db_rebuild_search_index,
+	rerender_posts as db_rerender_posts
 )
-from db_logic_posts import create_posts_table
+from db_pool import pool_stats
+from passwords import HashingBusy, hasher_stats
+from rate_limit import Policy, RateLimited, limiter
+from post_cache import post_cache
+import post_storage
+import compression
+import jobs
+import mdx_render
+import metrics
+import migrations
+import thumbnails
 
-load_dotenv()  # load env vars from .env if present
 app = Flask(__name__)
 # Config JWT desde .env
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "dev-secret-change-me")
 _jwt_expires_minutes = int(os.environ.get("JWT_ACCESS_TOKEN_EXPIRES_MINUTES", "480"))  # 8h por defecto
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=_jwt_expires_minutes)
+# Embed name/email in access tokens so /api/auth/check needs no lookup at all.
+# Off by default: claims stay as issued until the token expires.
+JWT_PROFILE_CLAIMS = os.environ.get("JWT_PROFILE_CLAIMS", "0").strip().lower() in ('1', 'true', 'yes', 'on')
 
 # Allow Authorization header and known dev origins so browsers/emulators can send the token
 CORS(app, resources={r"/api/*": {"origins": [
@@ -45,6 +89,46 @@ CORS(app, resources={r"/api/*": {"origins": [
 ]}}, expose_headers=["Authorization"], allow_headers=["Content-Type", "Authorization"], supports_credentials=True)
 jwt = JWTManager(app)
 
+# Feed pagination defaults
+FEED_DEFAULT_LIMIT = 20
+FEED_MAX_LIMIT = 100
+# Changes returned per GET /api/posts/changes call
+SYNC_DEFAULT_LIMIT = 100
+SYNC_MAX_LIMIT = 1000
+CONTENT_FORMATS = ('mdx',) + mdx_render.FORMATS
+# Rows fetched per DB round trip when streaming the full listing
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "256"))
+# Threads reading post files (MDX bodies, thumbnails, manifests) while a
+# listing is assembled; 1 reads them serially on the request thread
+POST_IO_CONCURRENCY = int(os.environ.get("POST_IO_CONCURRENCY", "8"))
+# Media caching: uploads are stored as <uuid><ext> and never rewritten
+_UUID_MEDIA_NAME_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.[A-Za-z0-9]+$')
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MEDIA_DEFAULT_MAX_AGE = 300
+# Let a fronting proxy send media files: 'x-sendfile' (Apache, lighttpd; the
+# header carries the absolute path) or 'x-accel-redirect' (nginx; the path
+# under POSTS_DIR is appended to MEDIA_ACCEL_PREFIX, which must map to
+# POSTS_DIR as an `internal` location). Empty: the app server sends them.
+MEDIA_OFFLOAD = os.environ.get("MEDIA_OFFLOAD", "").strip().lower()
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/protected-media/")
+if MEDIA_OFFLOAD not in ('', 'x-sendfile', 'x-accel-redirect'):
+	raise RuntimeError("MEDIA_OFFLOAD must be empty, 'x-sendfile' or 'x-accel-redirect'")
+# Width requested for feed card thumbnails (served as WebP/AVIF derivatives)
+FEED_THUMBNAIL_WIDTH = int(os.environ.get("FEED_THUMBNAIL_WIDTH", "320"))
+
+# Rate limits per route: token buckets per client IP and per identity
+# ("<n>/<second|minute|hour|day>"; override with RATE_LIMIT_<NAME>_IP/_IDENTITY).
+# Behind a reverse proxy, remote_addr is the proxy unless ProxyFix is set up.
+RATE_LIMITS = {
+	# Every attempt costs an Argon2 verify; per email too against password spraying
+	'login': Policy('login', per_ip='20/minute', per_identity='5/minute'),
+	'signup': Policy('signup', per_ip='5/minute'),
+	'account': Policy('account', per_ip='30/minute', per_identity='10/minute'),
+	'post_write': Policy('post_write', per_ip='60/minute'),
+	# Unauthenticated and expensive: seeding and wiping the DB
+	'admin': Policy('admin', per_ip='3/minute'),
+}
+
 # JWT error handlers to return JSON
 @jwt.unauthorized_loader
 def _unauthorized_loader(msg):
@@ -59,15 +143,142 @@ def _expired_token_loader(header, payload):
 	return jsonify({"error": "Token has expired"}), 401
 
 
-# Initialize DB tables at startup (safe, idempotent)
-create_table()
-create_posts_table()
+@jobs.handler('rerender_posts')
+def _rerender_posts_job(payload):
+	count = db_rerender_posts()
+	app.logger.info("Re-rendered %d post(s) for renderer v%d", count, mdx_render.RENDERER_VERSION)
+	return {'rendered': count}
+
+# Startup work is not done at import: under gunicorn (see gunicorn.conf.py)
+# init_db() runs once in the master before workers are forked and each
+# worker then starts its own job threads; serve-asgi runs it before starting
+# uvicorn, whose workers only call init_worker(). Other servers get both
+# lazily on the first request of each process.
+_db_ready = False
+_init_lock = threading.Lock()
+
+def init_db():
+	"""Check the schema version (applying pending migrations unless
+	MIGRATE_ON_START is off), resume interrupted jobs and queue a re-render
+	after a renderer upgrade. Idempotent; run once per deployment start."""
+	global _db_ready
+	with _init_lock:
+		if _db_ready:
+			return
+		migrations.ensure_current()
+		jobs.recover()
+		# Renderer upgraded since the artifacts were written: refresh them off-request
+		if mdx_render.needs_rerender():
+			jobs.enqueue('rerender_posts')
+		_db_ready = True
+
+def init_worker():
+	"""The per-process part of init_db, for server workers started after it
+	ran (uvicorn workers are fresh processes, they don't inherit _db_ready).
+	Only checks the schema version: resuming jobs here would requeue the
+	ones other live workers are running."""
+	global _db_ready
+	with _init_lock:
+		migrations.ensure_current()
+		_db_ready = True
+
+@app.before_request
+def _ensure_initialized():
+	if not _db_ready:
+		init_db()
+	jobs.start()
+
+if metrics.METRICS_ENABLED:
+	@app.before_request
+	def _start_request_timing():
+		metrics.start_request()
+
+	@app.after_request
+	def _finish_request_timing(resp):
+		rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+		timing = metrics.finish_request(request.method, rule, resp.status_code)
+		if timing is None:
+			return resp
+		duration, spans = timing
+		if metrics.SERVER_TIMING:
+			resp.headers['Server-Timing'] = metrics.server_timing(duration, spans)
+		if duration * 1000 >= metrics.SLOW_REQUEST_MS and random.random() < metrics.SLOW_REQUEST_SAMPLE_RATE:
+			app.logger.warning("Slow request %s %s -> %d in %.1f ms: %s", request.method, request.full_path.rstrip("?"),
+				resp.status_code, duration * 1000, metrics.server_timing(duration, spans))
+		return resp
+
+@app.after_request
+def _compress_response(resp):
+	"""Content-hash ETag (304 on a matching If-None-Match) for GET JSON
+	responses and negotiated compression of JSON/text bodies. Routes may set
+	their own ETag (feed) or encode the body themselves (cached posts)."""
+	if (resp.mimetype not in compression.COMPRESSIBLE_MIMETYPES or resp.status_code in (204, 304)
+			or resp.is_streamed or resp.direct_passthrough or 'Content-Encoding' in resp.headers):
+		return resp
+	data = resp.get_data()
+	resp.vary.add('Accept-Encoding')
+	encoding = compression.negotiate(request.accept_encodings) if len(data) >= compression.COMPRESSION_MIN_BYTES else None
+	if request.method in ('GET', 'HEAD') and resp.status_code == 200:
+		etag = resp.get_etag()[0] or compression.content_etag(data)
+		matched = compression.matching_etag(request.if_none_match, etag)
+		if matched:
+			return _not_modified(matched)
+		resp.set_etag(compression.encoded_etag(etag, encoding))
+	if encoding:
+		_set_encoded_body(resp, compression.compress(data, encoding), encoding)
+	return resp
+
+def _set_encoded_body(resp, body, encoding):
+	resp.set_data(body)
+	resp.headers['Content-Encoding'] = encoding
+	resp.vary.add('Accept-Encoding')
+
+def _not_modified(etag):
+	resp = app.response_class(status=304)
+	resp.set_etag(etag)
+	resp.vary.add('Accept-Encoding')
+	return resp
+
+@app.errorhandler(RateLimited)
+def _rate_limited(e):
+	resp = jsonify({"error": "Too many requests, please retry later"})
+	resp.headers["Retry-After"] = str(e.retry_after)
+	return resp, 429
+
+def rate_limited(name, identity=None):
+	"""Check the RATE_LIMITS[name] buckets before the view runs. `identity`
+	returns who the request is about (or None) for the per-identity bucket."""
+	policy = RATE_LIMITS[name]
+	def decorate(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			limiter.check(policy, request.remote_addr, identity() if identity else None)
+			return fn(*args, **kwargs)
+		return wrapper
+	return decorate
+
+def _login_identity():
+	data = request.get_json(silent=True) or {}
+	email = data.get("email")
+	return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def _token_identity():
+	identity = get_jwt_identity()
+	return str(identity) if identity is not None else None
+
+@app.errorhandler(HashingBusy)
+def _hashing_busy(e):
+	# Password hashing is saturated: shed load instead of queueing forever
+	resp = jsonify({"error": "Server busy, please retry"})
+	resp.headers["Retry-After"] = str(e.retry_after)
+	return resp, 503
 
 @app.get("/api/health")
 def health():
 	return jsonify({"status": "ok"})
 
 @app.post("/api/auth/signup")
+@rate_limited('signup')
 def signup():
 	data = request.get_json(silent=True) or {}
 	name = (data.get("name") or "").strip()
@@ -84,11 +295,14 @@ def signup():
 			return jsonify({"error": "Failed to create user"}), 500
 		user = db_get_user(user_id)
 		return jsonify({"user": user}), 201
+	except HashingBusy:
+		raise
 	except Exception as e:
 		# likely duplicate email or DB error
 		return jsonify({"error": str(e)}), 400
 
 @app.post("/api/auth/login")
+@rate_limited('login', identity=_login_identity)
 def login():
 	data = request.get_json(silent=True) or {}
 	email = (data.get("email") or "").strip().lower()
@@ -98,8 +312,28 @@ def login():
 	user = verify_credentials(email, password)
 	if not user:
 		return jsonify({"error": "Invalid credentials"}), 401
-	access_token = create_access_token(identity=str(user["id"]))
-	return jsonify({"user": user, "token": access_token}), 200
+	return jsonify({"user": user, "token": _access_token(user)}), 200
+
+def _access_token(user):
+	claims = {"name": user["name"], "email": user["email"]} if JWT_PROFILE_CLAIMS else None
+	return create_access_token(identity=str(user["id"]), additional_claims=claims)
+
+def _current_user():
+	"""Profile of the token's user: from its claims when JWT_PROFILE_CLAIMS is
+	on, else from the profile cache (the DB only on a miss)."""
+	identity = get_jwt_identity()
+	if identity is None:
+		return None
+	try:
+		uid = int(identity)
+	except (TypeError, ValueError):
+		return None
+	if JWT_PROFILE_CLAIMS:
+		claims = get_jwt()
+		if 'name' in claims and 'email' in claims:
+			metrics.inc('blog_user_profile_lookups_total', source='token')
+			return {"id": uid, "name": claims['name'], "email": claims['email']}
+	return get_user_cached(uid)
 
 @app.get("/api/users/<int:user_id>")
 @jwt_required()
@@ -108,25 +342,58 @@ def get_user(user_id: int):
 	# Simple rule: only allow fetching your own profile
 	if int(current_user_id) != int(user_id):
 		return jsonify({"error": "Forbidden"}), 403
-	user = db_get_user(user_id)
+	user = get_user_cached(user_id)
 	if not user:
 		return jsonify({"error": "User not found"}), 404
 	return jsonify({"user": user})
 
+@app.patch("/api/users/<int:user_id>")
+@jwt_required()
+@rate_limited('account', identity=_token_identity)
+def update_user(user_id: int):
+	"""Change your own name and/or email. Returns the updated profile (and a
+	fresh token when tokens carry profile claims)."""
+	if int(get_jwt_identity()) != int(user_id):
+		return jsonify({"error": "Forbidden"}), 403
+	data = request.get_json(silent=True) or {}
+	name = data.get("name")
+	email = data.get("email")
+	name = name.strip() if isinstance(name, str) else None
+	email = email.strip().lower() if isinstance(email, str) else None
+	if not name and not email:
+		return jsonify({"error": "Nothing to update (name, email)"}), 400
+	try:
+		if not db_update_user(user_id, name=name or None, email=email or None):
+			return jsonify({"error": "User not found"}), 404
+	except sqlite3.IntegrityError:
+		return jsonify({"error": "Email already registered"}), 409
+	if name:
+		# Linked posts show the profile name: new change numbers make feed
+		# ETags and syncing clients pick the rename up
+		db_mark_author_changed(user_id)
+	user = db_get_user(user_id)
+	body = {"user": user}
+	if JWT_PROFILE_CLAIMS:
+		body["token"] = _access_token(user)
+	return jsonify(body), 200
+
 @app.delete("/api/users/<int:user_id>")
 @jwt_required()
+@rate_limited('account', identity=_token_identity)
 def delete_user(user_id: int):
+	"""Delete your account together with the posts linked to it."""
 	current_user_id = get_jwt_identity()
 	# Simple rule: only allow deleting your own profile
 	if int(current_user_id) != int(user_id):
 		return jsonify({"error": "Forbidden"}), 403
 	if not db_get_user(user_id):
 		return jsonify({"error": "User not found"}), 404
-	if delete_user(user_id):
+	if db_delete_user_and_posts(user_id):
 		return jsonify({"message": "User deleted"}), 200
 	return jsonify({"error": "Failed to delete user"}), 500
 
 @app.delete("/api/clear_db")
+@rate_limited('admin')
 def clear_db():
 	clear_users()
 	return jsonify({"message": "All users deleted"}), 200
@@ -136,17 +403,9 @@ def clear_db():
 def auth_check():
 	"""Return the current user for a valid token."""
 	try:
-		current_user_id = get_jwt_identity()
-		if current_user_id is None:
+		if get_jwt_identity() is None:
 			return jsonify({"error": "Missing identity in token"}), 401
-
-		# db_get_user expects an integer id; try to cast when possible
-		try:
-			uid = int(current_user_id)
-		except Exception:
-			uid = current_user_id
-
-		user = db_get_user(uid)
+		user = _current_user()
 		if not user:
 			return jsonify({"error": "User not found"}), 404
 		return jsonify({"user": user}), 200
@@ -180,161 +439,715 @@ def debug_decode_token():
 	except Exception as e:
 		return jsonify({"error": "Failed to decode token payload", "detail": str(e)}), 400
 
+@app.get('/api/debug/db-pool')
+def debug_db_pool():
+	"""Connection pool counters per database file (for monitoring)."""
+	return jsonify({"pools": pool_stats()}), 200
 
-@app.get("/api/posts")
-def get_posts():
-	raw = db_get_posts()
-	posts = []
-	for row in raw:
+@app.get('/api/debug/hasher')
+def debug_hasher():
+	"""Argon2 parameters and hash/verify/reject counters."""
+	return jsonify({"hasher": hasher_stats()}), 200
+
+@app.get('/api/debug/cache')
+def debug_cache():
+	"""Hit/miss/eviction counters of the in-process post and user profile caches."""
+	return jsonify({"post_cache": post_cache.stats(), "user_cache": user_cache.stats()}), 200
+
+@app.get('/api/metrics')
+def prometheus_metrics():
+	"""Request and span latency histograms in Prometheus text format."""
+	if not metrics.METRICS_ENABLED:
+		return jsonify({"error": "Metrics are disabled (METRICS_ENABLED=0)"}), 404
+	return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.get('/api/debug/rate-limits')
+def debug_rate_limits():
+	"""Allowed/limited counts per policy and the number of live buckets."""
+	return jsonify({"rate_limits": limiter.stats()}), 200
+
+@app.get('/api/debug/jobs')
+def debug_jobs():
+	"""Background job counts by status and worker threads of this process."""
+	return jsonify({"jobs": jobs.job_stats()}), 200
+
+
+def _read_post_mdx(content_ref):
+	"""Read a post's MDX body from its storage ref, or None if unreadable."""
+	try:
+		return post_storage.read_text(content_ref)
+	except Exception:
+		return None
+
+def _flag_arg(name, default=False):
+	"""Parse a boolean query string flag such as ?inline_thumbnails=1."""
+	value = request.args.get(name)
+	if value is None:
+		return default
+	return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _thumbnail_fields(thumb_ref, inline=False):
+	"""Return (thumbnail_url, thumbnail_base64) for a stored thumbnail.
+
+	The base64 data URL is only built when `inline` is requested; by default
+	clients load the image from `thumbnail_url`, which is HTTP-cacheable.
+	"""
+	try:
+		if not inline:
+			return _thumbnail_url(thumb_ref), None
+		tb = post_storage.read_bytes(thumb_ref)
+		if tb is None:
+			return None, None
+		filename = post_storage.media_name(thumb_ref)
+		# URL the frontend can use to load the image
+		thumbnail_url = url_for('serve_post_media', filename=filename, _external=True)
+		ext = os.path.splitext(filename)[1].lstrip('.') or 'png'
+		with metrics.span('encode.base64'):
+			thumb_b64 = f"data:image/{ext};base64,{base64.b64encode(tb).decode('ascii')}"
+		return thumbnail_url, thumb_b64
+	except Exception:
+		return None, None
+
+def _thumbnail_url(thumb_ref, width=None):
+	"""Media URL of a stored thumbnail. The ref is trusted: checking that
+	it exists would cost a stat or query per card, and the route answers
+	404 for a missing file anyway."""
+	if not thumb_ref:
+		return None
+	params = {'w': width} if width else {}
+	return url_for('serve_post_media', filename=post_storage.media_name(thumb_ref), _external=True, **params)
+
+def _content_format():
+	"""?format= for post bodies: 'mdx' (raw, default), 'html' or 'ast'."""
+	fmt = (request.args.get('format') or 'mdx').strip().lower()
+	if fmt not in CONTENT_FORMATS:
+		raise ValueError("format must be one of: " + ", ".join(CONTENT_FORMATS))
+	return fmt
+
+def _post_full(row, inline_thumbnails=False, content_format='mdx'):
+	pid, thumb_rel, title, content_rel, author, created_at, author_id, _, _ = row
+	thumbnail_url, thumb_b64 = _thumbnail_fields(thumb_rel, inline_thumbnails)
+	post = {
+		'id': pid,
+		'title': title,
+		'thumbnail': thumb_rel,
+		'thumbnail_base64': thumb_b64,
+		'thumbnail_url': thumbnail_url,
+		'author': author,
+		'author_id': author_id,
+		'created_at': created_at,
+	}
+	mdx_text = _read_post_mdx(content_rel)
+	if content_format == 'mdx':
+		post['content'] = mdx_text
+	else:
+		# Pre-rendered once per body on the server (see mdx_render)
+		with metrics.span('render.' + content_format):
+			post['content_' + content_format] = mdx_render.get_rendered(mdx_text, content_format)
+	return post
+
+def _post_summary(row):
+	"""Slim projection for feed cards: no body, no inline image. Reads no
+	files: the excerpt and placeholder are stored with the row."""
+	pid, thumb_rel, title, _, author, created_at, author_id, excerpt, placeholder = row
+	return {
+		'id': pid,
+		'title': title,
+		'author': author,
+		'author_id': author_id,
+		'created_at': created_at,
+		'thumbnail_url': _thumbnail_url(thumb_rel, FEED_THUMBNAIL_WIDTH),
+		# Tiny blurred data URL to show while the card image loads
+		'thumbnail_placeholder': placeholder,
+		'excerpt': excerpt,
+	}
+
+_io_pool = None
+_io_pool_key = None
+_io_pool_lock = threading.Lock()
+
+def _post_io_pool():
+	"""Shared pool for post file reads, created per process (threads don't
+	survive a fork) and rebuilt if POST_IO_CONCURRENCY changes."""
+	global _io_pool, _io_pool_key
+	key = (os.getpid(), POST_IO_CONCURRENCY)
+	with _io_pool_lock:
+		if _io_pool_key != key:
+			_io_pool = ThreadPoolExecutor(max_workers=POST_IO_CONCURRENCY, thread_name_prefix='post-io')
+			_io_pool_key = key
+		return _io_pool
+
+def _build_chunk(build, rows):
+	built = []
+	for row in rows:
 		try:
-			pid, thumb_rel, title, content_rel, author, created_at = row
+			built.append(build(row))
 		except Exception:
 			continue
-		mdx_text = None
-		thumb_b64 = None
-		thumbnail_url = None
-		# Load MDX content
+	return built
+
+def _build_posts(build, rows):
+	"""[build(row) for row in rows] in order, skipping rows whose build fails.
+
+	Building a post reads its files (MDX body, thumbnail, derivative
+	manifest); on a slow or cold volume those blocking reads add up, so the
+	rows are split into chunks built concurrently on POST_IO_CONCURRENCY
+	threads. Each chunk runs in a copy of the request context (url_for,
+	request.args), and its spans (io.read, encode.*) are added to the
+	request's own."""
+	rows = list(rows)
+	with metrics.span('build.posts'):
+		if POST_IO_CONCURRENCY <= 1 or len(rows) < 2:
+			return _build_chunk(build, rows)
+		size = -(-len(rows) // (POST_IO_CONCURRENCY * 4))
+		# One request context copy per chunk: a copy can't be pushed on two
+		# threads at once
+		futures = [
+			_post_io_pool().submit(copy_current_request_context(metrics.collect_spans),
+				_build_chunk, build, rows[i:i + size])
+			for i in range(0, len(rows), size)
+		]
+		built = []
+		for f in futures:
+			posts, spans = f.result()
+			metrics.add_spans(spans)
+			built.extend(posts)
+		return built
+
+def _iter_built_posts(build):
+	batch = []
+	for row in db_iter_posts(STREAM_BATCH_SIZE):
+		batch.append(row)
+		if len(batch) >= STREAM_BATCH_SIZE:
+			yield from _build_posts(build, batch)
+			batch = []
+	yield from _build_posts(build, batch)
+
+def _stream_posts(build, ndjson=False):
+	"""Stream every post as it is read instead of building the full list."""
+	dumps = app.json.dumps
+	if ndjson:
+		def generate():
+			for post in _iter_built_posts(build):
+				yield dumps(post) + '\n'
+		mimetype = 'application/x-ndjson'
+	else:
+		def generate():
+			yield '{"posts": ['
+			first = True
+			for post in _iter_built_posts(build):
+				yield (dumps(post) if first else ',' + dumps(post))
+				first = False
+			yield ']}\n'
+		mimetype = 'application/json'
+	# stream_with_context keeps url_for() usable while the body is generated
+	return app.response_class(stream_with_context(generate()), status=200, mimetype=mimetype)
+
+def _encode_cursor(created_at, post_id):
+	raw = json.dumps([created_at, post_id], separators=(',', ':')).encode('utf-8')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(token):
+	"""Inverse of _encode_cursor. Raises ValueError on malformed tokens."""
+	try:
+		padding = '=' * (-len(token) % 4)
+		created_at, post_id = json.loads(base64.urlsafe_b64decode(token + padding))
+	except Exception:
+		raise ValueError("Invalid cursor")
+	if (created_at is not None and not isinstance(created_at, str)) or not isinstance(post_id, int):
+		raise ValueError("Invalid cursor")
+	return created_at, post_id
+
+
+@app.get("/api/posts")
+def get_posts():
+	"""List posts.
+
+	Without `limit`/`cursor` the whole table is returned with full content
+	(legacy behaviour). With them, posts come newest first in pages of
+	`limit` (default 20, max 100) plus a `next_cursor` token for the next page,
+	using the slim summary projection unless `view=full` is requested.
+	`author_id=` (user id), `author=` (exact name) and `from=`/`to=`
+	(ISO-8601; from inclusive, to exclusive) filter the paginated feed, e.g.
+	for author pages.
+	Full posts only embed `thumbnail_base64` with `?inline_thumbnails=1`.
+
+	The full listing can be streamed with `?stream=1` (same JSON shape) or as
+	NDJSON, one post per line, with `Accept: application/x-ndjson`; memory
+	then stays flat regardless of how many posts exist.
+	"""
+	args = request.args
+	paginated = any(k in args for k in ('limit', 'cursor', 'author', 'author_id', 'from', 'to'))
+	view = args.get('view', 'summary' if paginated else 'full')
+	if view not in ('summary', 'full'):
+		return jsonify({"error": "view must be 'summary' or 'full'"}), 400
+	if view == 'summary':
+		build = _post_summary
+	else:
 		try:
-			mdx_path = os.path.join(os.path.dirname(__file__), content_rel)
-			with open(mdx_path, 'r', encoding='utf-8') as f:
-				mdx_text = f.read()
-		except Exception:
-			mdx_text = None
-		# Load thumbnail as data URL
+			content_format = _content_format()
+		except ValueError as e:
+			return jsonify({"error": str(e)}), 400
+		build = functools.partial(_post_full, inline_thumbnails=_flag_arg('inline_thumbnails'),
+			content_format=content_format)
+
+	if not paginated:
+		if request.accept_mimetypes.best == 'application/x-ndjson':
+			return _stream_posts(build, ndjson=True)
+		if _flag_arg('stream'):
+			return _stream_posts(build, ndjson=False)
+
+	# Revalidation is answered from the change counter alone, before any post is read
+	etag = _feed_etag()
+	matched = compression.matching_etag(request.if_none_match, etag)
+	if matched:
+		return _not_modified(matched)
+
+	if not paginated:
+		posts = _build_posts(build, db_get_posts())
+		with metrics.span('serialize.json'):
+			resp = jsonify({"posts": posts})
+		resp.set_etag(etag)
+		return resp, 200
+
+	try:
+		limit = int(args.get('limit', FEED_DEFAULT_LIMIT))
+	except ValueError:
+		return jsonify({"error": "limit must be an integer"}), 400
+	limit = max(1, min(limit, FEED_MAX_LIMIT))
+	after = None
+	try:
+		if args.get('cursor'):
+			after = _decode_cursor(args['cursor'])
+		since = normalize_timestamp(args.get('from'))
+		until = normalize_timestamp(args.get('to'))
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	author = args.get('author') or None
+	author_id = None
+	if args.get('author_id'):
 		try:
-			thumb_path = os.path.join(os.path.dirname(__file__), thumb_rel)
-			if os.path.exists(thumb_path):
-				filename = os.path.basename(thumb_path)
-				# URL the frontend can use to load the image
-				thumbnail_url = url_for('serve_post_media', filename=filename, _external=True)
-				with open(thumb_path, 'rb') as f:
-					tb = f.read()
-				ext = os.path.splitext(thumb_path)[1].lstrip('.') or 'png'
-				thumb_b64 = f"data:image/{ext};base64,{base64.b64encode(tb).decode('ascii')}"
-		except Exception:
-			thumb_b64 = None
-			thumbnail_url = None
-		posts.append({
-			'id': pid,
-			'title': title,
-			'thumbnail': thumb_rel,
-			'thumbnail_base64': thumb_b64,
-			'thumbnail_url': thumbnail_url,
-			'content': mdx_text,
-			'author': author,
-			'created_at': created_at,
-		})
-	return jsonify({"posts": posts}), 200
+			author_id = int(args['author_id'])
+		except ValueError:
+			return jsonify({"error": "author_id must be an integer"}), 400
+
+	# Fetch one extra row to know whether another page exists
+	rows = db_get_posts_page(limit + 1, after, author=author, since=since, until=until, author_id=author_id)
+	has_more = len(rows) > limit
+	rows = rows[:limit]
+	posts = _build_posts(build, rows)
+	next_cursor = _encode_cursor(rows[-1][5], rows[-1][0]) if has_more else None
+	with metrics.span('serialize.json'):
+		resp = jsonify({"posts": posts, "next_cursor": next_cursor})
+	resp.set_etag(etag)
+	return resp, 200
+
+def _feed_etag():
+	"""Collection ETag for GET /api/posts: the posts change counter (bumped by
+	every create, update and delete) plus everything else the body depends on
+	(query, host of the absolute URLs, renderer version)."""
+	key = '|'.join([
+		str(db_get_change_seq()),
+		request.host_url,
+		str(mdx_render.RENDERER_VERSION),
+		'&'.join(sorted(f"{k}={v}" for k, v in request.args.items(multi=True))),
+	])
+	return 'feed-' + compression.content_etag(key.encode('utf-8'))
+
+@app.get("/api/posts/search")
+def search_posts():
+	"""Full-text search over title, author and body.
+
+	`?q=` is required; results are ranked best-first and paginated with
+	`limit` (default 20, max 100) and `offset`. Each hit is a summary post
+	plus `title_highlighted` and a body `snippet`: HTML-escaped text with
+	matches wrapped in <mark>…</mark>.
+	"""
+	q = (request.args.get('q') or '').strip()
+	if not q:
+		return jsonify({"error": "Missing search query 'q'"}), 400
+	try:
+		limit = int(request.args.get('limit', FEED_DEFAULT_LIMIT))
+		offset = int(request.args.get('offset', 0))
+	except ValueError:
+		return jsonify({"error": "limit and offset must be integers"}), 400
+	limit = max(1, min(limit, FEED_MAX_LIMIT))
+	offset = max(0, offset)
+	# One extra row tells us whether there is a next page
+	rows = db_search_posts(q, limit + 1, offset)
+	has_more = len(rows) > limit
+
+	def build_hit(row):
+		hit = _post_summary(row[:9])
+		hit['title_highlighted'] = row[9]
+		hit['snippet'] = row[10]
+		return hit
+	results = _build_posts(build_hit, rows[:limit])
+	return jsonify({
+		"posts": results,
+		"next_offset": offset + limit if has_more else None,
+	}), 200
+
+@app.get("/api/posts/changes")
+def get_post_changes():
+	"""Incremental sync: what changed since the client's last sync token.
+
+	`?since=` is the `next_since` of the previous call (omit it or pass 0
+	for a first, full sync). Returns changed posts in `posts` (summary view,
+	or `view=full`), ids of deleted posts in `deleted`, the token to send
+	next time in `next_since`, and `has_more` when another call is needed
+	(at most `limit` changes per call, default 100, max 1000). Answers 410
+	with `"reset": true` when the token is too old or from another copy of
+	the database (reset or restored), and the client must drop its copy
+	and sync from 0.
+	"""
+	args = request.args
+	try:
+		since = int(args.get('since') or 0)
+		limit = int(args.get('limit', SYNC_DEFAULT_LIMIT))
+	except ValueError:
+		return jsonify({"error": "since and limit must be integers"}), 400
+	if since < 0:
+		return jsonify({"error": "since must not be negative"}), 400
+	limit = max(1, min(limit, SYNC_MAX_LIMIT))
+	view = args.get('view', 'summary')
+	if view not in ('summary', 'full'):
+		return jsonify({"error": "view must be 'summary' or 'full'"}), 400
+	build = _post_summary if view == 'summary' else _post_full
+
+	rows, latest, reset = db_get_changes(since, limit + 1)
+	if reset:
+		return jsonify({"error": "Sync token expired or unknown, sync again from 0", "reset": True}), 410
+	has_more = len(rows) > limit
+	rows = rows[:limit]
+	# row[10] is deleted_at: tombstones only report the id
+	deleted = [row[0] for row in rows if row[10]]
+
+	def build_changed(row):
+		post = build(row[:9])
+		post['updated_at'] = row[9]
+		return post
+	posts = _build_posts(build_changed, [row for row in rows if not row[10]])
+	next_since = rows[-1][11] if has_more else latest
+	with metrics.span('serialize.json'):
+		return jsonify({
+			"posts": posts,
+			"deleted": deleted,
+			"next_since": str(next_since),
+			"has_more": has_more,
+		}), 200
 
 @app.get("/api/posts/<int:post_id>")
 def get_post(post_id: int):
+	inline = _flag_arg('inline_thumbnails')
+	try:
+		content_format = _content_format()
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	# thumbnail_url is absolute, so the host is part of the cache key
+	variant = (request.host_url, inline, content_format)
+	generation = post_cache.generation(post_id)
+	cached = post_cache.get(post_id, variant)
+	if cached is not None:
+		return _cached_post_response(post_id, variant, cached, generation=generation)
 	post = db_get_post(post_id)
 	if not post:
 		return jsonify({"error": "Post not found"}), 404
 	try:
-		pid, thumb_rel, title, content_rel, author, created_at = post
+		payload = _post_full(post, inline, content_format)
 	except Exception:
 		return jsonify({"error": "Invalid post data"}), 500
-	mdx_text = None
-	thumb_b64 = None
-	try:
-		mdx_path = os.path.join(os.path.dirname(__file__), content_rel)
-		with open(mdx_path, 'r', encoding='utf-8') as f:
-			mdx_text = f.read()
-	except Exception:
-		mdx_text = None
-	try:
-		thumb_path = os.path.join(os.path.dirname(__file__), thumb_rel)
-		if os.path.exists(thumb_path):
-			filename = os.path.basename(thumb_path)
-			thumbnail_url = url_for('serve_post_media', filename=filename, _external=True)
-			with open(thumb_path, 'rb') as f:
-				tb = f.read()
-			ext = os.path.splitext(thumb_path)[1].lstrip('.') or 'png'
-			thumb_b64 = f"data:image/{ext};base64,{base64.b64encode(tb).decode('ascii')}"
-	except Exception:
-		thumb_b64 = None
-		thumbnail_url = None
-	return jsonify({"post": {
-		'id': pid,
-		'title': title,
-		'thumbnail': thumb_rel,
-		'thumbnail_base64': thumb_b64,
-		'thumbnail_url': thumbnail_url, # type: ignore
-		'content': mdx_text,
-	}}), 200
+	with metrics.span('serialize.json'):
+		body = jsonify({"post": payload}).get_data()
+	source_files = [p for p in (post_storage.local_path(post[1]), post_storage.local_path(post[3])) if p]
+	post_cache.put(post_id, variant, body, files=source_files, generation=generation)
+	return _cached_post_response(post_id, variant, body, source_files, generation, fresh=True)
 
+def _cached_post_response(post_id, variant, body, files=(), generation=None, fresh=False):
+	"""Serve a serialized post: 304 when If-None-Match names its content
+	hash, otherwise the body in the negotiated encoding. Compressed copies
+	live in post_cache next to the plain body, so a hot post is compressed
+	once, not per request. `fresh` bodies were just rebuilt, so any older
+	compressed copy is replaced rather than reused."""
+	etag = compression.content_etag(body)
+	matched = compression.matching_etag(request.if_none_match, etag)
+	if matched:
+		return _not_modified(matched)
+	resp = app.response_class(body, status=200, mimetype='application/json')
+	encoding = compression.negotiate(request.accept_encodings) if len(body) >= compression.COMPRESSION_MIN_BYTES else None
+	if encoding:
+		key = variant + (encoding,)
+		encoded = None if fresh else post_cache.get(post_id, key)
+		if encoded is None:
+			encoded = compression.compress(body, encoding)
+			post_cache.put(post_id, key, encoded, files=files, generation=generation)
+		_set_encoded_body(resp, encoded, encoding)
+	resp.set_etag(compression.encoded_etag(etag, encoding))
+	return resp
 
-@app.get('/media/posts/<path:filename>')
-def serve_post_media(filename: str):
-	posts_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'posts'))
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_media(filename):
+	"""(full path, MIME type, immutable?) for a media URL name, or None for
+	names that try to leave POSTS_DIR. Pure string work, so it is cached."""
 	# Prevent path traversal
 	filename = os.path.normpath(filename)
-	if '..' in filename.replace('\\', '/'):
+	if '..' in filename.replace('\\', '/') or os.path.isabs(filename):
+		return None
+	mime_type, _ = mimetypes.guess_type(filename)
+	# UUID-named files are never rewritten in place (see update_post)
+	immutable = bool(_UUID_MEDIA_NAME_RE.match(os.path.basename(filename)))
+	return os.path.join(post_storage.POSTS_DIR, filename), mime_type or 'application/octet-stream', immutable
+
+@app.get('/media/posts/<path:filename>')
+def serve_post_media(filename: str):
+	"""Serve a stored post file. With ?w=<px>, image thumbnails are answered
+	with the closest resized derivative in a format the client accepts."""
+	resolved = _resolve_media(filename)
+	if resolved is None:
 		return jsonify({'error': 'Invalid filename'}), 400
-	full_path = os.path.join(posts_dir, filename)
-	if not os.path.exists(full_path):
-		return jsonify({'error': 'Not found'}), 404
-	mime_type, _ = mimetypes.guess_type(full_path)
-	if not mime_type:
-		mime_type = 'application/octet-stream'
-	return send_file(full_path, mimetype=mime_type)
+	full_path, mime_type, immutable = resolved
+	width = request.args.get('w', type=int)
+	if width:
+		if os.path.isfile(full_path):
+			digest = thumbnails.file_digest(full_path)
+			load_source = lambda: _read_file(full_path)
+			ref = os.path.relpath(full_path, post_storage.CODE_DIR)
+		else:
+			# Content-addressed blobs (POST_STORAGE=db) are served as <sha256><ext>
+			blob_match = post_storage.BLOB_MEDIA_NAME_RE.match(os.path.basename(full_path))
+			digest = blob_match.group(1) if blob_match else None
+			load_source = lambda: post_storage.get_blob(digest)
+			ref = post_storage.BLOB_PREFIX + os.path.basename(full_path)
+		if digest:
+			resp = _serve_derivative(digest, width, load_source, ref)
+			if resp is not None:
+				return resp
+	else:
+		digest = None
+	try:
+		resp = _send_media_file(full_path, mime_type,
+			MEDIA_IMMUTABLE_MAX_AGE if immutable else MEDIA_DEFAULT_MAX_AGE, immutable)
+	except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+		resp = _serve_blob_media(os.path.basename(full_path))
+	if width and digest and resp.status_code in (200, 206, 304):
+		resp.vary.add('Accept')
+		if thumbnails.load_manifest(digest) is None:
+			# A derivative is on its way; don't let clients pin the original
+			resp.cache_control.immutable = False
+			resp.cache_control.max_age = MEDIA_DEFAULT_MAX_AGE
+	return resp
 
-@app.post("/api/posts")
-def create_post():
-	data = request.get_json(silent=True) or {}
-	title = (data.get("title") or "").strip()
-	mdx = (data.get("content") or "").strip()
-	if not title or not mdx:
-		return jsonify({"error": "Missing title or content"}), 400
+def _send_media_file(full_path, mime_type, max_age, immutable=False):
+	"""Send a file with one open() and fstat() and without copying it
+	through Python: the body goes to the server's wsgi.file_wrapper
+	(sendfile(2) under gunicorn) or, with MEDIA_OFFLOAD, to the proxy.
+
+	Same headers as send_file(conditional=True): ETag/Last-Modified with 304
+	answers, and 206 for Range requests (left to the proxy when offloading).
+	Raises FileNotFoundError when the file is gone."""
+	f = open(full_path, 'rb')
+	try:
+		st = os.fstat(f.fileno())
+		offload = _offload_target(full_path) if MEDIA_OFFLOAD else None
+		if offload:
+			f.close()
+			resp = app.response_class(mimetype=mime_type)
+			resp.headers['X-Sendfile' if MEDIA_OFFLOAD == 'x-sendfile' else 'X-Accel-Redirect'] = offload
+		else:
+			resp = app.response_class(wrap_file(request.environ, f), mimetype=mime_type, direct_passthrough=True)
+			resp.content_length = st.st_size
+		resp.last_modified = st.st_mtime
+		resp.set_etag(f"{st.st_mtime}-{st.st_size}-{zlib.adler32(full_path.encode()) & 0xFFFFFFFF}")
+		resp.cache_control.public = True
+		resp.cache_control.max_age = max_age
+		resp.expires = int(time.time() + max_age)
+		if immutable:
+			# Clients and CDNs can keep these without revalidating
+			resp.cache_control.immutable = True
+		resp = resp.make_conditional(request.environ, accept_ranges=not offload,
+			complete_length=None if offload else st.st_size)
+	except BaseException:
+		f.close()
+		raise
+	if offload and resp.status_code == 304:
+		# Some proxies send the file anyway when the header is present
+		resp.headers.pop('X-Sendfile', None)
+		resp.headers.pop('X-Accel-Redirect', None)
+	return resp
+
+def _offload_target(full_path):
+	"""Header value telling the proxy which file to send, or None when the
+	file can't be expressed for it (outside POSTS_DIR for x-accel-redirect)."""
+	full_path = os.path.abspath(full_path)
+	if MEDIA_OFFLOAD == 'x-sendfile':
+		return full_path
+	rel = os.path.relpath(full_path, os.path.abspath(post_storage.POSTS_DIR))
+	if rel.startswith('..'):
+		return None
+	return MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + rel.replace(os.sep, '/')
+
+def _read_file(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+def _serve_derivative(digest, width, load_source, ref):
+	"""Send the best variant of `digest` for `width` and the Accept header, or
+	return None so the original is sent. Missing derivatives are queued on the
+	thumbnails worker pool, never built on the request thread; once built,
+	the posts showing `ref` get its placeholder (and a new change number)."""
+	picked = thumbnails.pick_variant(digest, width, request.accept_mimetypes)
+	if picked is None:
+		if thumbnails.load_manifest(digest) is None:
+			future = thumbnails.schedule(load_source())
+			if future is not None:
+				future.add_done_callback(functools.partial(_derivatives_built, ref))
+		return None
+	path, mime_type = picked
+	# Variants are derived from content-addressed sources, so never change
+	try:
+		resp = _send_media_file(path, mime_type, MEDIA_IMMUTABLE_MAX_AGE, immutable=True)
+	except FileNotFoundError:
+		return None
+	resp.vary.add('Accept')
+	return resp
+
+def _derivatives_built(ref, future):
+	manifest = future.result()
+	if manifest:
+		try:
+			db_store_placeholder(ref, manifest.get('lqip'))
+		except Exception:
+			app.logger.warning("Could not store the placeholder of %s", ref, exc_info=True)
+
+def _serve_blob_media(filename):
+	match = post_storage.BLOB_MEDIA_NAME_RE.match(filename)
+	data = post_storage.get_blob(match.group(1)) if match else None
+	if data is None:
+		# A response object, not a tuple: serve_post_media adjusts headers
+		resp = jsonify({'error': 'Not found'})
+		resp.status_code = 404
+		return resp
+	mime_type, _ = mimetypes.guess_type(filename)
+	# The name is the content hash, so it doubles as a strong ETag
+	resp = send_file(
+		BytesIO(data),
+		mimetype=mime_type or 'application/octet-stream',
+		conditional=True,
+		etag=match.group(1),
+		max_age=MEDIA_IMMUTABLE_MAX_AGE,
+	)
+	resp.cache_control.immutable = True
+	return resp
+
+SAMPLE_THUMBNAIL_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
+# Upper bound on posts accepted by one POST /api/posts/bulk request
+BULK_MAX_POSTS = int(os.environ.get("BULK_MAX_POSTS", "5000"))
 
-	# Optional thumbnail in base64 (data URL or raw base64)
-	thumb_b64_in = data.get('thumbnail_base64')
-	sample_thumbnail_b64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
+def _decode_thumbnail(thumb_b64_in):
+	"""Decode an optional thumbnail (data URL or raw base64); falls back to a 1x1 PNG."""
 	if thumb_b64_in:
 		if ',' in thumb_b64_in:
 			thumb_b64_in = thumb_b64_in.split(',', 1)[1]
 		try:
-			thumbnail_bytes = base64.b64decode(thumb_b64_in)
+			return base64.b64decode(thumb_b64_in)
 		except Exception:
-			thumbnail_bytes = base64.b64decode(sample_thumbnail_b64)
-	else:
-		thumbnail_bytes = base64.b64decode(sample_thumbnail_b64)
+			pass
+	return base64.b64decode(SAMPLE_THUMBNAIL_B64)
 
-	content_obj = {
+def _post_content_from_json(data, user=None):
+	"""Build the (title, content dict) pair db_create_post expects from a
+	request body, or raise ValueError when title/content are missing. With a
+	signed-in `user` the post is linked to their account and shows their name."""
+	title = (data.get("title") or "").strip()
+	mdx = (data.get("content") or "").strip()
+	if not title or not mdx:
+		raise ValueError("Missing title or content")
+	return title, {
 		'mdx': mdx,
-		'thumbnail_bytes': thumbnail_bytes,
+		# Optional thumbnail in base64 (data URL or raw base64)
+		'thumbnail_bytes': _decode_thumbnail(data.get('thumbnail_base64')),
 		'thumbnail_ext': data.get('thumbnail_ext', '.png'),
-		'author': data.get('author'),
+		'author': user['name'] if user else data.get('author'),
+		'author_id': user['id'] if user else None,
 		'created_at': data.get('created_at'),
 	}
-	post_id = db_create_post(title, content_obj)
+
+@app.post("/api/posts")
+@jwt_required(optional=True)
+@rate_limited('post_write')
+def create_post():
+	data = request.get_json(silent=True) or {}
+	try:
+		title, content_obj = _post_content_from_json(data, _current_user())
+		post_id = db_create_post(title, content_obj)
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
 	return jsonify({"post_id": post_id}), 201
 
+@app.post("/api/posts/bulk")
+@jwt_required(optional=True)
+@rate_limited('post_write')
+def create_posts_bulk():
+	"""Create many posts in one request.
+
+	Body: {"posts": [<same fields as POST /api/posts>, ...]}. Every item is
+	validated before anything is written; returns the new ids in input order.
+	"""
+	data = request.get_json(silent=True) or {}
+	items = data.get("posts")
+	if not isinstance(items, list) or not items:
+		return jsonify({"error": "Body must contain a non-empty 'posts' list"}), 400
+	if len(items) > BULK_MAX_POSTS:
+		return jsonify({"error": f"At most {BULK_MAX_POSTS} posts per request"}), 413
+	user = _current_user()
+	batch = []
+	for i, item in enumerate(items):
+		if not isinstance(item, dict):
+			return jsonify({"error": f"posts[{i}]: expected an object"}), 400
+		try:
+			title, content_obj = _post_content_from_json(item, user)
+		except ValueError as e:
+			return jsonify({"error": f"posts[{i}]: {e}"}), 400
+		batch.append(dict(content_obj, title=title))
+	try:
+		post_ids = db_create_posts_bulk(batch)
+	except ValueError as e:
+		return jsonify({"error": str(e)}), 400
+	return jsonify({"post_ids": post_ids}), 201
+
 @app.delete("/api/posts/<int:post_id>")
+@rate_limited('post_write')
 def delete_post(post_id: int):
 	if db_delete_post(post_id):
 		return jsonify({"message": "Post deleted"}), 200
-	return jsonify({"error": "Failed to delete post"}), 500
+	return jsonify({"error": "Post not found"}), 404
 
 
 @app.post('/api/posts/seed')
+@rate_limited('admin')
 def seed_posts():
-	"""Create sample posts for testing.
+	"""Create sample posts for testing, in the background.
 
 	Accepts optional JSON body: {"count": <int>} (default 3).
-	Each post will have a small PNG thumbnail and simple MDX content.
+	Each post will have a PNG thumbnail and simple MDX content. Answers 202
+	with the job id; poll GET /api/jobs/<id> for the created titles.
 	"""
 	data = request.get_json(silent=True) or {}
 	try:
 		count = int(data.get('count', 3))
 	except Exception:
 		count = 3
+	count = max(1, min(count, BULK_MAX_POSTS))
+	job_id = jobs.enqueue('seed_posts', {'count': count}, max_attempts=1)
+	return _job_accepted(job_id)
 
+@jobs.handler('seed_posts')
+def _seed_posts_job(payload):
+	count = payload.get('count', 3)
 	# Prefer to generate a larger PNG thumbnail with a colored border using Pillow.
 	# If Pillow is not available for any reason, fall back to a 1x1 transparent PNG.
 	try:
-		from io import BytesIO
 		from PIL import Image, ImageDraw # type: ignore
 
 		def make_colored_thumbnail(width=600, height=400, border_color="#3498db", border_thickness=20):
@@ -351,35 +1164,137 @@ def seed_posts():
 		thumbnail_bytes = make_colored_thumbnail()
 	except Exception:
 		# Fallback to a tiny transparent PNG if Pillow isn't installed or generation fails
-		sample_thumbnail_b64 = (
-			"iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
-		)
 		try:
-			thumbnail_bytes = base64.b64decode(sample_thumbnail_b64)
+			thumbnail_bytes = base64.b64decode(SAMPLE_THUMBNAIL_B64)
 		except Exception:
 			thumbnail_bytes = b""
 
-	created = []
+	batch = []
 	for i in range(max(1, count)):
 		title = f"Sample post {i+1}"
 		mdx = f"# {title}\n\nEsto es un post de prueba generado automáticamente.\n\nContenido de ejemplo."
-		content = {
+		batch.append({
+			'title': title,
 			'mdx': mdx,
 			'thumbnail_bytes': thumbnail_bytes,
 			'thumbnail_ext': '.png',
 			'author': 'system',
-			'created_at': datetime.datetime.now().isoformat(),
-		}
-		try:
-			# db_create_post writes files and inserts into the DB
-			db_create_post(title, content)
-			created.append(title)
-		except Exception as e:
-			app.logger.exception('Failed to create sample post')
-			return jsonify({'error': 'Failed creating sample posts', 'detail': str(e)}), 500
+		})
+	# One transaction for the whole batch instead of a commit per post
+	post_ids = db_create_posts_bulk(batch)
+	return {'created': [item['title'] for item in batch], 'post_ids': post_ids}
+
+def _job_accepted(job_id):
+	resp = jsonify({'job_id': job_id, 'status_url': url_for('get_job', job_id=job_id, _external=True)})
+	resp.headers['Location'] = url_for('get_job', job_id=job_id)
+	return resp, 202
+
+@app.get('/api/jobs/<int:job_id>')
+def get_job(job_id: int):
+	"""Status of a background job: queued, running, done (with its result) or failed."""
+	job = jobs.get_job(job_id)
+	if job is None:
+		return jsonify({'error': 'Job not found'}), 404
+	return jsonify(job), 200
 
-	return jsonify({'created': created}), 201
+@app.cli.command("migrate-storage")
+@click.option("--to", "target", type=click.Choice(["fs", "db"]), required=True,
+	help="Backend to move post bodies and thumbnails into.")
+def migrate_storage_command(target):
+	"""Move existing posts to another storage backend (see post_storage)."""
+	moved = db_migrate_storage(target)
+	click.echo(f"Migrated {moved} post(s) to '{target}' storage")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+	"""Re-index all existing posts for GET /api/posts/search."""
+	count = db_rebuild_search_index()
+	click.echo(f"Indexed {count} post(s)")
+
+@app.cli.command("rerender-posts")
+def rerender_posts_command():
+	"""Render every post body to HTML/AST with the current renderer."""
+	count = db_rerender_posts()
+	click.echo(f"Rendered {count} post(s) with renderer v{mdx_render.RENDERER_VERSION}")
+
+@app.cli.command("prune-tombstones")
+@click.option("--days", type=float, default=30, show_default=True,
+	help="Remove tombstones of posts deleted longer ago than this.")
+def prune_tombstones_command(days):
+	"""Drop old deletion records used by GET /api/posts/changes."""
+	count = db_prune_tombstones(days)
+	click.echo(f"Pruned {count} tombstone(s)")
+
+@app.cli.command("init-db")
+def init_db_command():
+	"""Create the database tables (also done on server start)."""
+	init_db()
+	click.echo("Database ready")
+
+@app.cli.command("migrate")
+@click.option("--check", is_flag=True, help="Only list pending migrations; exit status 1 if there are any.")
+def migrate_command(check):
+	"""Apply pending schema migrations (run at deploy time, before serving)."""
+	if check:
+		for name, info in migrations.status().items():
+			click.echo(f"{name}: v{info['version']} of v{info['latest']}")
+			for step in info['pending']:
+				click.echo(f"  pending {step}")
+		if migrations.pending():
+			raise SystemExit(1)
+		return
+	applied = migrations.migrate()
+	for step in applied:
+		click.echo(f"Applied {step}")
+	click.echo(f"Schema up to date ({len(applied)} migration(s) applied)")
+
+@app.cli.command("serve")
+@click.option("--bind", default=None, help="host:port (default 0.0.0.0:$PORT).")
+@click.option("--workers", type=int, default=None, help="Worker processes (default from CPU count).")
+@click.option("--threads", type=int, default=None, help="Threads per worker.")
+def serve_command(bind, workers, threads):
+	"""Run the API under gunicorn with the settings in gunicorn.conf.py.
+
+	SIGHUP gracefully replaces the workers; to deploy new code without
+	downtime send SIGUSR2 (starts a new master) and then SIGTERM the old one.
+	"""
+	code_dir = os.path.dirname(os.path.abspath(__file__))
+	argv = ["gunicorn", "--chdir", code_dir, "--config", os.path.join(code_dir, "gunicorn.conf.py")]
+	if bind:
+		argv += ["--bind", bind]
+	if workers:
+		argv += ["--workers", str(workers)]
+	if threads:
+		argv += ["--threads", str(threads)]
+	argv.append("app:app")
+	try:
+		os.execvp(argv[0], argv)
+	except FileNotFoundError:
+		raise click.ClickException("gunicorn is not installed (pip install -r requirements.txt)")
+
+@app.cli.command("serve-asgi")
+@click.option("--bind", default=None, help="host:port (default 0.0.0.0:$PORT).")
+@click.option("--workers", type=int, default=None, help="Worker processes (default WEB_CONCURRENCY or 1).")
+def serve_asgi_command(bind, workers):
+	"""Run the API under uvicorn through asgi.py: views run on a bounded
+	thread pool (ASGI_THREADS) and responses are sent from an event loop, so
+	slow or idle connections don't hold threads."""
+	# Once, before any worker starts (like gunicorn's on_starting)
+	init_db()
+	code_dir = os.path.dirname(os.path.abspath(__file__))
+	host, _, port = (bind or f"0.0.0.0:{os.environ.get('PORT', '3000')}").rpartition(":")
+	workers = workers or int(os.environ.get("WEB_CONCURRENCY", "1"))
+	# Workers size their per-process limits from it (see passwords.configure)
+	os.environ["WEB_CONCURRENCY"] = str(workers)
+	argv = ["uvicorn", "asgi:application", "--app-dir", code_dir, "--host", host or "0.0.0.0", "--port", port,
+		"--workers", str(workers), "--lifespan", "on"]
+	try:
+		os.execvp(argv[0], argv)
+	except FileNotFoundError:
+		raise click.ClickException("uvicorn is not installed (pip install -r requirements.txt)")
 
 if __name__ == "__main__":
+	# Development server; use `flask --app app serve` in production
+	init_db()
 	port = int(os.environ.get("PORT", "3000"))
 	app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,229 @@
+"""ASGI entry point: the API served from an asyncio event loop.
+
+    flask --app app serve-asgi
+    (or: flask --app app init-db && uvicorn asgi:application)
+
+Under the WSGI servers an in-flight request holds a worker thread from the
+first byte in to the last byte out, including while a slow client downloads
+a post image or a long feed. Here the Flask view still runs on a thread,
+because SQLite and the file APIs have no non-blocking form, but only while
+it computes the response. The body is then sent from the event loop. File
+bodies (/media/posts, streamed listings) are read one chunk at a time on the
+pool between sends, and each send waits for the client to drain. Open, idle
+or slow connections cost a socket and a coroutine, not a thread, and
+ASGI_THREADS bounds how many requests are worked on at once.
+
+Every route, header and JSON body is the one app.py produces; only the
+transport differs.
+"""
+import asyncio
+import contextvars
+import functools
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from werkzeug.wsgi import FileWrapper  # type: ignore
+
+import jobs
+import passwords
+from app import app, init_worker
+
+# Threads running views and reading bodies (the most requests worked on at once)
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "32"))
+# Bytes read per step of a file or streamed body; the first step runs with
+# the view, so bodies up to this size go out in one message
+ASGI_BODY_CHUNK = int(os.environ.get("ASGI_BODY_CHUNK", str(256 * 1024)))
+
+logger = logging.getLogger(__name__)
+
+
+def _file_wrapper(f, buffer_size=8192):
+    # wsgi.file_wrapper: wrap_file() asks for 8 KiB blocks; send bigger ones
+    # so a large file takes fewer pool round trips
+    return FileWrapper(f, max(buffer_size, ASGI_BODY_CHUNK))
+
+
+def _environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ for an ASGI HTTP request (PEP 3333 string rules)."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': _file_wrapper,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class _Response:
+    """What the view thread hands back: status, headers, the body read so
+    far and, if there is more, the iterator to keep reading from."""
+
+    __slots__ = ('status', 'headers', 'chunks', 'rest', 'app_iter')
+
+    def __init__(self):
+        self.status = 500
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.chunks: List[bytes] = []
+        self.rest = None
+        self.app_iter = None
+
+
+def _read_some(it, limit: int) -> Tuple[List[bytes], bool]:
+    """Up to about `limit` bytes from a WSGI body iterator; True when done."""
+    chunks, size = [], 0
+    while size < limit:
+        try:
+            chunk = next(it)
+        except StopIteration:
+            return chunks, True
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+    return chunks, False
+
+
+def _run_view(environ: Dict) -> _Response:
+    result = _Response()
+
+    def start_response(status, headers, exc_info=None):
+        result.status = int(status.split(' ', 1)[0])
+        result.headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return result.chunks.append
+
+    app_iter = app.wsgi_app(environ, start_response)
+    try:
+        it = iter(app_iter)
+        chunks, done = _read_some(it, ASGI_BODY_CHUNK)
+    except BaseException:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+        raise
+    result.chunks.extend(chunks)
+    if done:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    else:
+        result.rest, result.app_iter = it, app_iter
+    return result
+
+
+class AsgiApp:
+    """ASGI application running the Flask app's views on a bounded pool."""
+
+    def __init__(self, threads: int = ASGI_THREADS):
+        self.threads = threads
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Created in the serving process (uvicorn may fork workers)
+        if self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    async def _call(self, ctx: contextvars.Context, fn, *args):
+        """Run fn(*args) on the pool inside the request's context. Every step
+        of a request reuses the same context (one at a time), so Flask's
+        request context pushed by a streamed body survives between steps."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), functools.partial(ctx.run, fn, *args))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    # init_db ran once before the workers started (serve-asgi)
+                    await self._call(contextvars.copy_context(), init_worker)
+                    # serve-asgi passes its --workers on in WEB_CONCURRENCY
+                    passwords.configure(int(os.environ.get("WEB_CONCURRENCY", "1")), self.threads)
+                    jobs.start()
+                except Exception as e:
+                    logger.exception("Startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._pool is not None and self._pool_pid == os.getpid():
+                    self._pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        ctx = contextvars.copy_context()
+        response = await self._call(ctx, _run_view, _environ(scope, b''.join(body)))
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': response.headers})
+        if response.rest is None:
+            await send({'type': 'http.response.body', 'body': b''.join(response.chunks)})
+            return
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            chunks, done = response.chunks, False
+            while True:
+                if disconnected.is_set():
+                    break
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': not done})
+                if done:
+                    break
+                chunks, done = await self._call(ctx, _read_some, response.rest, ASGI_BODY_CHUNK)
+        finally:
+            watcher.cancel()
+            if hasattr(response.app_iter, 'close'):
+                await self._call(ctx, response.app_iter.close)
+
+
+application = AsgiApp()
@@ -0,0 +1,78 @@
+"""Negotiated response compression and content-hash ETags.
+
+gzip is always available; zstd (``zstandard``) and brotli (``brotli``) are
+used when those packages are installed; they are only imported on first
+use, so they don't slow down startup. Bodies smaller than
+COMPRESSION_MIN_BYTES are sent as they are: the framing costs more than it
+saves.
+"""
+import functools
+import gzip
+import hashlib
+import importlib
+import importlib.util
+import os
+from typing import Optional
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# Best first; only encodings whose library is installed
+ENCODINGS = tuple(
+    name for name, module in (('zstd', 'zstandard'), ('br', 'brotli'), ('gzip', None))
+    if module is None or importlib.util.find_spec(module) is not None
+)
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html')
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """The encoding to use for a client's ``Accept-Encoding`` (werkzeug's
+    request.accept_encodings): highest client q-value, ties going to the
+    better codec. None means send the body as it is."""
+    best, best_q = None, 0.0
+    for name in ENCODINGS:
+        q = accept_encodings[name]
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+@functools.lru_cache(maxsize=None)
+def _module(name: str):
+    return importlib.import_module(name)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        # mtime=0 keeps the output (and anything cached from it) deterministic
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'br':
+        return _module('brotli').compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'zstd':
+        return _module('zstandard').ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def content_etag(data: bytes) -> str:
+    """Strong validator for an (uncompressed) body."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    # Each encoding is a different representation, so it gets its own tag
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def matching_etag(if_none_match, etag: str) -> Optional[str]:
+    """The tag from werkzeug's If-None-Match set that names `etag` in any
+    encoding (what a 304 should echo back), or None."""
+    if not if_none_match:
+        return None
+    if if_none_match.star_tag:
+        return etag
+    for tag in if_none_match.as_set(include_weak=True):
+        if tag == etag or tag.startswith(etag + '-'):
+            return tag
+    return None
@@ -1,20 +1,159 @@
+import datetime
+import logging
 import sqlite3
 import os
-from typing import Optional, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Iterator, List, Tuple
 
-# Posts DB lives under the repository's db/ folder
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db', 'posts.db'))
+import jobs
+import mdx_render
+import metrics
+import migrations
+import post_search
+import post_storage
+import thumbnails
+from db_logic_users import DB_PATH as USERS_DB_PATH, user_cache
+from db_pool import begin_write, get_pool
+from mdx_text import make_excerpt
+from post_cache import post_cache
+
+# Posts DB lives under the repository's db/ folder (DB_DIR overrides it)
+DB_DIR = os.environ.get("DB_DIR") or os.path.join(os.path.dirname(__file__), '..', 'db')
+DB_PATH = os.path.abspath(os.path.join(DB_DIR, 'posts.db'))
+# Threads used to write post files in create_posts_bulk
+POST_WRITE_CONCURRENCY = int(os.environ.get("POST_WRITE_CONCURRENCY", "8"))
+# Length of the plain-text excerpt stored with each post for feed cards
+EXCERPT_CHARS = 200
+
+logger = logging.getLogger(__name__)
+
+
+# The standard post row: (id, thumbnail, title, content, author, created_at,
+# author_id, excerpt, placeholder). users.db is attached to every posts
+# connection, so the name of a linked author comes from their profile in the
+# same query (renames show up everywhere); unlinked posts keep their
+# free-text author. The excerpt is computed from the body when it is written
+# (see make_excerpt), the thumbnail placeholder once its derivatives exist
+# (see store_placeholder).
+POST_COLUMNS = ('p.id, p.thumbnail, p.title, p.content, COALESCE(u.name, p.author), p.created_at, p.author_id, '
+                'p.excerpt, p.placeholder')
+POSTS_WITH_AUTHOR = 'posts p LEFT JOIN users.users u ON u.id = p.author_id'
+PostRow = Tuple[int, str, str, str, Optional[str], Optional[str], Optional[int], Optional[str], Optional[str]]
 
 
 def _get_conn():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+    """Borrow a pooled connection (use as a context manager)."""
+    return get_pool(DB_PATH, attach={'users': USERS_DB_PATH}).connection()
+
+
+def _process_in_background(post_ids: List[int]) -> Optional[int]:
+    """Queue the post-write work (HTML/AST artifacts, thumbnail derivatives)
+    for `post_ids`. Failures are logged only: artifacts are also built on
+    first read. Returns the job id."""
+    if not post_ids:
+        return None
+    try:
+        return jobs.enqueue('post_artifacts', {'post_ids': post_ids})
+    except Exception:
+        logger.warning("Failed to queue post processing", exc_info=True)
+        return None
+
+
+@jobs.handler('post_artifacts')
+def _post_artifacts_job(payload: Dict) -> Dict:
+    rendered = derived = 0
+    for post_id in payload.get('post_ids', []):
+        row = get_post(int(post_id))
+        if row is None:
+            continue  # deleted meanwhile
+        mdx_render.ensure_rendered(post_storage.read_text(row[3]))
+        rendered += 1
+        thumb = post_storage.read_bytes(row[1])
+        if not thumb:
+            continue
+        manifest = thumbnails.generate(thumb)
+        if manifest is not None:
+            derived += 1
+            store_placeholder(row[1], manifest.get('lqip'))
+    return {'rendered': rendered, 'thumbnails': derived}
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """Canonical form of a client-supplied timestamp: UTC ISO-8601 with
+    milliseconds, like _now(), so that text order is time order and range
+    filters can use the created_at index. Accepts ISO dates and datetimes
+    ('Z' or an offset; naive values are taken as UTC). Returns None for an
+    empty value and raises ValueError for anything unparseable."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if not isinstance(value, str):
+        raise ValueError("Timestamps must be ISO-8601 strings")
+    text = value.strip()
+    if text[-1:] in ('Z', 'z'):
+        # fromisoformat only takes 'Z' from Python 3.11 on; JavaScript's
+        # toISOString() always ends with it
+        text = text[:-1] + '+00:00'
+    try:
+        dt = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}' (expected ISO-8601, e.g. 2024-05-01T12:00:00Z)")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(datetime.timezone.utc).isoformat(timespec='milliseconds')
 
 
-def create_posts_table() -> None:
-    conn = _get_conn()
-    c = conn.cursor()
-    c.execute(
+# created_at values already in canonical form (see normalize_timestamp)
+_CANONICAL_TS_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]:[0-9][0-9]:[0-9][0-9].[0-9][0-9][0-9]+00:00'
+
+
+def _normalize_created_at(conn: sqlite3.Connection) -> None:
+    """Rewrite created_at values stored verbatim by older versions. Missing
+    or unparseable ones fall back to updated_at (or now); rewritten rows get
+    a new change number so sync clients refetch them."""
+    rows = conn.execute('SELECT id, created_at, updated_at FROM posts WHERE created_at IS NULL '
+                        'OR created_at NOT GLOB ?', (_CANONICAL_TS_GLOB,)).fetchall()
+    for post_id, created_at, updated_at in rows:
+        try:
+            fixed = normalize_timestamp(created_at)
+        except ValueError:
+            logger.warning("Post %d has an unparseable created_at %r; using its update time", post_id, created_at)
+            fixed = None
+        if fixed is None:
+            fixed = normalize_timestamp(updated_at) if updated_at else _now()
+        conn.execute('UPDATE posts SET created_at = ?, change_seq = ? WHERE id = ?',
+                     (fixed, _next_change_seq(conn), post_id))
+
+
+def _next_change_seq(conn: sqlite3.Connection, count: int = 1) -> int:
+    """Reserve `count` consecutive change numbers and return the last one.
+
+    Must run inside the write transaction: SQLite serializes writers, so
+    numbers are handed out in commit order and a reader that has seen N
+    will never later find a new row numbered below N.
+    """
+    return conn.execute('UPDATE sync_state SET seq = seq + ? WHERE id = 1 RETURNING seq', (count,)).fetchone()[0]
+
+
+@metrics.timed('db.posts.get_change_seq')
+def get_change_seq() -> int:
+    """Latest change number: moves on every create, update and delete, so it
+    versions the whole posts collection."""
+    with _get_conn() as conn:
+        row = conn.execute('SELECT seq FROM sync_state WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+# Registered after users: post queries join the attached users table
+migrations.database('posts', _get_conn)
+
+
+@migrations.migration('posts', 1, 'posts table')
+def _create_posts_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
         '''
         CREATE TABLE IF NOT EXISTS posts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,149 +165,602 @@ def create_posts_table() -> None:
         )
         '''
     )
-    # Ensure columns exist for older DBs: add missing columns
-    c.execute("PRAGMA table_info('posts')")
-    cols = [r[1] for r in c.fetchall()]
-    if 'author' not in cols:
-        try:
-            c.execute("ALTER TABLE posts ADD COLUMN author TEXT")
-        except Exception:
-            pass
-    if 'created_at' not in cols:
-        try:
-            c.execute("ALTER TABLE posts ADD COLUMN created_at TEXT")
-        except Exception:
-            pass
-    conn.commit()
-    conn.close()
+    # Early databases lacked these
+    migrations.add_column(conn, 'posts', 'author', 'TEXT')
+    migrations.add_column(conn, 'posts', 'created_at', 'TEXT')
+
+
+@migrations.migration('posts', 2, 'change numbers and tombstones for sync')
+def _add_sync_columns(conn: sqlite3.Connection) -> None:
+    # GET /api/posts/changes: every write stamps the row with the next change
+    # sequence number; deletes leave a tombstone
+    migrations.add_column(conn, 'posts', 'updated_at', 'TEXT')
+    migrations.add_column(conn, 'posts', 'deleted_at', 'TEXT')
+    migrations.add_column(conn, 'posts', 'change_seq', 'INTEGER')
+    conn.execute("UPDATE posts SET change_seq = id WHERE change_seq IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_change_seq ON posts (change_seq)")
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL,
+            pruned_seq INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+    conn.execute("INSERT OR IGNORE INTO sync_state (id, seq) SELECT 1, COALESCE(MAX(change_seq), 0) FROM posts")
+
+
+@migrations.migration('posts', 3, 'blob storage and full-text search')
+def _create_blobs_and_search(conn: sqlite3.Connection) -> None:
+    post_storage.create_blobs_table(conn)
+    post_search.create_search_table(conn)
+
+
+@migrations.migration('posts', 4, 'canonical created_at and feed indexes')
+def _add_feed_indexes(conn: sqlite3.Connection) -> None:
+    _normalize_created_at(conn)
+    # Feed pages (ORDER BY created_at, id) and author pages / date filters
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_created ON posts (created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_author_created ON posts (author, created_at)")
+
+
+@migrations.migration('posts', 5, 'author_id link to users')
+def _add_author_id(conn: sqlite3.Connection) -> None:
+    # users.db is attached, so SQLite can't enforce this as a FOREIGN KEY
+    # (delete_user_and_posts keeps it tidy)
+    migrations.add_column(conn, 'posts', 'author_id', 'INTEGER')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_author_id_created ON posts (author_id, created_at)")
+
 
+@migrations.migration('posts', 6, "linked posts store their author's current name")
+def _sync_linked_authors(conn: sqlite3.Connection) -> None:
+    # Renames before this version only changed the displayed name
+    rows = conn.execute('SELECT p.id, u.name FROM posts p JOIN users.users u ON u.id = p.author_id '
+                        'WHERE p.deleted_at IS NULL AND p.author IS NOT u.name').fetchall()
+    _set_author(conn, rows)
 
+
+@migrations.migration('posts', 7, 'stored feed excerpts')
+def _add_excerpt(conn: sqlite3.Connection) -> None:
+    migrations.add_column(conn, 'posts', 'excerpt', 'TEXT')
+    rows = conn.execute('SELECT id, content FROM posts WHERE deleted_at IS NULL AND excerpt IS NULL').fetchall()
+    conn.executemany('UPDATE posts SET excerpt = ? WHERE id = ?',
+                     ((_excerpt(post_storage.read_text(content_ref)), post_id) for post_id, content_ref in rows))
+
+
+@migrations.migration('posts', 8, 'stored thumbnail placeholders')
+def _add_placeholder(conn: sqlite3.Connection) -> None:
+    migrations.add_column(conn, 'posts', 'placeholder', 'TEXT')
+    # The post_artifacts job fills them in (and rebuilds older derivatives)
+    post_ids = [r[0] for r in conn.execute(
+        "SELECT id FROM posts WHERE deleted_at IS NULL AND thumbnail != '' ORDER BY id")]
+    for start in range(0, len(post_ids), 500):
+        _process_in_background(post_ids[start:start + 500])
+
+
+def _excerpt(mdx: Optional[str]) -> Optional[str]:
+    return make_excerpt(mdx, EXCERPT_CHARS)
+
+
+def _set_author(conn: sqlite3.Connection, rows: List[Tuple[int, str]]) -> None:
+    """Store a new author name on posts ((id, name) rows) and their search
+    entries, with new change numbers so clients refetch them."""
+    if not rows:
+        return
+    first_seq = _next_change_seq(conn, len(rows)) - len(rows) + 1
+    now = _now()
+    for i, (post_id, name) in enumerate(rows):
+        conn.execute('UPDATE posts SET author = ?, updated_at = ?, change_seq = ? WHERE id = ?',
+                     (name, now, first_seq + i, post_id))
+        post_search.set_author(conn, post_id, name)
+
+
+@metrics.timed('db.posts.create_post')
 def create_post(title: str, content: Dict) -> int:
-    """Create a post by writing MDX and thumbnail files under `posts/` and
-    inserting a DB row. Returns the new row id.
+    """Create a post by storing its MDX body and thumbnail (see post_storage)
+    and inserting a DB row. Returns the new row id.
 
     `content` must be a dict with keys:
       - 'mdx': str
       - 'thumbnail_bytes': bytes
       - 'thumbnail_ext': str (e.g. '.png')
+    and optionally 'author', 'author_id' (users.id of the author) and
+    'created_at' (ISO-8601, default now; raises ValueError when unparseable).
     """
-    import uuid
-    # Ensure the posts table exists (safe to call multiple times)
-    try:
-        create_posts_table()
-    except Exception:
-        # best-effort; continue and let DB errors surface
-        pass
-    posts_dir = os.path.join(os.path.dirname(__file__), '..', 'posts')
-    os.makedirs(posts_dir, exist_ok=True)
-
     mdx_content = content['mdx']
     thumbnail_bytes = content['thumbnail_bytes']
     thumbnail_ext = content['thumbnail_ext']
 
-    post_id = str(uuid.uuid4())
-    mdx_filename = f"{post_id}.mdx"
-    thumbnail_filename = f"{post_id}{thumbnail_ext}"
+    # Determine author and created_at from content or set defaults
+    author = content.get('author') if isinstance(content, dict) else None
+    author_id = content.get('author_id') if isinstance(content, dict) else None
+    created_at = normalize_timestamp(content.get('created_at') if isinstance(content, dict) else None) or _now()
 
-    mdx_path = os.path.abspath(os.path.join(posts_dir, mdx_filename))
-    thumbnail_path = os.path.abspath(os.path.join(posts_dir, thumbnail_filename))
+    storage = post_storage.get_storage()
+    refs = []
+    try:
+        with _get_conn() as conn:
+            # Blob writes (db backend) share this transaction with the row
+            refs.append(storage.put(conn, mdx_content.encode('utf-8'), '.mdx'))
+            refs.append(storage.put(conn, thumbnail_bytes, thumbnail_ext))
+            c = conn.cursor()
+            c.execute(
+                'INSERT INTO posts (thumbnail, title, content, excerpt, author, author_id, created_at, updated_at, '
+                'change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (refs[1], title, refs[0], _excerpt(mdx_content), author, author_id, created_at, _now(),
+                 _next_change_seq(conn)),
+            )
+            post_search.index_post(conn, c.lastrowid, title, author, mdx_content)
+            rowid = c.lastrowid
+    except Exception:
+        # Don't leave orphaned files behind when the row was never written
+        for ref in refs:
+            post_storage.purge(ref)
+        raise
+    if rowid is not None:
+        post_cache.invalidate(int(rowid))
+        _process_in_background([int(rowid)])
+    return int(rowid) if rowid is not None else -1
 
-    # write files
-    with open(mdx_path, 'w', encoding='utf-8') as f:
-        f.write(mdx_content)
-    with open(thumbnail_path, 'wb') as f:
-        f.write(thumbnail_bytes)
 
-    # store paths relative to the code directory so they are portable
-    rel_mdx_path = os.path.relpath(mdx_path, os.path.dirname(__file__))
-    rel_thumbnail_path = os.path.relpath(thumbnail_path, os.path.dirname(__file__))
+@metrics.timed('db.posts.create_posts_bulk')
+def create_posts_bulk(posts: List[Dict]) -> List[int]:
+    """Create many posts at once and return their ids, in input order.
 
-    # Determine author and created_at from content or set defaults
-    from datetime import datetime
-    author = content.get('author') if isinstance(content, dict) else None
-    created_at = content.get('created_at') if isinstance(content, dict) else None
+    Each item is a `create_post` content dict plus a 'title' key. Everything
+    is validated before anything is written; bodies and thumbnails are then
+    stored concurrently (filesystem backend) and all rows are inserted with a
+    single `executemany` in one transaction, instead of one commit per post.
+    Raises ValueError (naming the offending index) on invalid input.
+    """
+    created: List[Optional[str]] = []
+    for i, item in enumerate(posts):
+        if not isinstance(item, dict):
+            raise ValueError(f"posts[{i}]: expected an object")
+        if not isinstance(item.get('title'), str) or not item['title'].strip():
+            raise ValueError(f"posts[{i}]: missing title")
+        if not isinstance(item.get('mdx'), str) or not item['mdx'].strip():
+            raise ValueError(f"posts[{i}]: missing mdx content")
+        if not isinstance(item.get('thumbnail_bytes'), (bytes, bytearray)):
+            raise ValueError(f"posts[{i}]: thumbnail_bytes must be bytes")
+        if not isinstance(item.get('thumbnail_ext'), str):
+            raise ValueError(f"posts[{i}]: thumbnail_ext must be a string")
+        try:
+            created.append(normalize_timestamp(item.get('created_at')))
+        except ValueError as e:
+            raise ValueError(f"posts[{i}]: {e}")
+    if not posts:
+        return []
+
+    storage = post_storage.get_storage()
+    payloads = []
+    for item in posts:
+        payloads.append((item['mdx'].encode('utf-8'), '.mdx'))
+        payloads.append((bytes(item['thumbnail_bytes']), item['thumbnail_ext']))
 
-    # Perform insert, retry creating table on OperationalError if necessary
+    refs: List[str] = []
     try:
-        conn = _get_conn()
-        c = conn.cursor()
-        c.execute('INSERT INTO posts (thumbnail, title, content, author, created_at) VALUES (?, ?, ?, ?, ?)',
-                  (rel_thumbnail_path, title, rel_mdx_path, author, created_at))
-        conn.commit()
-        rowid = c.lastrowid
-        conn.close()
-    except sqlite3.OperationalError:
-        # Table might be missing or missing columns; try to create/alter and retry once
-        create_posts_table()
-        conn = _get_conn()
+        if storage.concurrent_writes:
+            with ThreadPoolExecutor(max_workers=POST_WRITE_CONCURRENCY) as pool:
+                refs = list(pool.map(lambda p: storage.put(None, *p), payloads))
+        with _get_conn() as conn:
+            # Hold the write lock for the whole batch so AUTOINCREMENT ids
+            # are consecutive and can be derived from last_insert_rowid().
+            begin_write(conn, 'sync_state')
+            if not storage.concurrent_writes:
+                refs = [storage.put(conn, data, ext) for data, ext in payloads]
+            last_seq = _next_change_seq(conn, len(posts))
+            first_seq = last_seq - len(posts) + 1
+            now = _now()
+            rows = [
+                (refs[2 * i + 1], item['title'], refs[2 * i], _excerpt(item['mdx']), item.get('author'),
+                 item.get('author_id'), created[i] or now, now, first_seq + i)
+                for i, item in enumerate(posts)
+            ]
+            conn.executemany(
+                'INSERT INTO posts (thumbnail, title, content, excerpt, author, author_id, created_at, updated_at, '
+                'change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            first_id = last_id - len(posts) + 1
+            post_search.index_posts(conn, (
+                (first_id + i, item['title'], item.get('author'), item['mdx'])
+                for i, item in enumerate(posts)
+            ))
+    except Exception:
+        if storage.concurrent_writes:
+            for ref in refs:
+                post_storage.purge(ref)
+        raise
+    ids = list(range(first_id, last_id + 1))
+    for post_id in ids:
+        post_cache.invalidate(post_id)
+    _process_in_background(ids)
+    return ids
+
+
+@metrics.timed('db.posts.get_posts')
+def get_posts() -> List[PostRow]:
+    with _get_conn() as conn:
         c = conn.cursor()
-        c.execute('INSERT INTO posts (thumbnail, title, content, author, created_at) VALUES (?, ?, ?, ?, ?)',
-                  (rel_thumbnail_path, title, rel_mdx_path, author, created_at))
-        conn.commit()
-        rowid = c.lastrowid
-        conn.close()
-    return int(rowid) if rowid is not None else -1
+        c.execute(f'SELECT {POST_COLUMNS} FROM {POSTS_WITH_AUTHOR} WHERE p.deleted_at IS NULL')
+        posts = c.fetchall()
+    return posts
+
 
+def iter_posts(batch_size: int = 256) -> Iterator[PostRow]:
+    """Yield every post in id order without loading the whole table.
 
-def get_posts() -> List[Tuple[int, str, str, str, Optional[str], Optional[str]]]:
-    conn = _get_conn()
-    c = conn.cursor()
-    c.execute('SELECT id, thumbnail, title, content, author, created_at FROM posts')
-    posts = c.fetchall()
-    conn.close()
+    Rows are read in keyset batches of `batch_size`, each on a briefly
+    borrowed connection, so a slow consumer (e.g. a streamed HTTP response)
+    never pins a connection or a read transaction.
+    """
+    last_id = 0
+    while True:
+        with metrics.span('db.posts.iter_posts'), _get_conn() as conn:
+            batch = conn.execute(
+                f'SELECT {POST_COLUMNS} FROM {POSTS_WITH_AUTHOR} '
+                'WHERE p.id > ? AND p.deleted_at IS NULL ORDER BY p.id LIMIT ?',
+                (last_id, batch_size),
+            ).fetchall()
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1][0]
+
+
+def _feed_query(limit: int, after: Optional[Tuple[Optional[str], int]] = None, author: Optional[str] = None,
+                since: Optional[str] = None, until: Optional[str] = None,
+                author_id: Optional[int] = None) -> Tuple[str, list]:
+    """SQL and parameters of a feed page (see get_posts_page). Every variant
+    is answered in order from idx_posts_created, idx_posts_author_created or
+    idx_posts_author_id_created, plus a primary-key lookup of each row's
+    author; tests/test_query_plans.py checks the plans."""
+    query = f'SELECT {POST_COLUMNS} FROM {POSTS_WITH_AUTHOR} WHERE p.deleted_at IS NULL'
+    params: list = []
+    if author_id is not None:
+        query += ' AND p.author_id = ?'
+        params.append(author_id)
+    if author is not None:
+        query += ' AND p.author = ?'
+        params.append(author)
+    if since is not None:
+        query += ' AND p.created_at >= ?'
+        params.append(since)
+    if until is not None:
+        query += ' AND p.created_at < ?'
+        params.append(until)
+    if after is not None:
+        after_created, after_id = after
+        if after_created is None:
+            # Cursor from before created_at was always set
+            query += ' AND p.created_at IS NULL AND p.id < ?'
+            params.append(after_id)
+        else:
+            query += ' AND (p.created_at, p.id) < (?, ?)'
+            params.extend([after_created, after_id])
+    query += ' ORDER BY p.created_at DESC, p.id DESC LIMIT ?'
+    params.append(limit)
+    return query, params
+
+
+@metrics.timed('db.posts.get_posts_page')
+def get_posts_page(limit: int, after: Optional[Tuple[Optional[str], int]] = None, author: Optional[str] = None,
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   author_id: Optional[int] = None) -> List[PostRow]:
+    """Return up to `limit` posts, newest first, using keyset pagination.
+
+    Rows are ordered by `(created_at, id)` descending. `after` is the
+    `(created_at, id)` of the last row of the previous page. Optionally only
+    posts of the user `author_id` or shown under the name `author` (linked
+    posts store their user's current name, see mark_author_changed), and/or
+    created in [`since`, `until`) (canonical timestamps, see
+    normalize_timestamp).
+    """
+    query, params = _feed_query(limit, after, author, since, until, author_id)
+    with _get_conn() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        posts = c.fetchall()
     return posts
 
 
-def get_post(post_id: int) -> Optional[Tuple[int, str, str, str, Optional[str], Optional[str]]]:
-    conn = _get_conn()
-    c = conn.cursor()
-    c.execute('SELECT id, thumbnail, title, content, author, created_at FROM posts WHERE id = ?', (post_id,))
-    post = c.fetchone()
-    conn.close()
+@metrics.timed('db.posts.get_post')
+def get_post(post_id: int) -> Optional[PostRow]:
+    with _get_conn() as conn:
+        c = conn.cursor()
+        c.execute(f'SELECT {POST_COLUMNS} FROM {POSTS_WITH_AUTHOR} '
+                  'WHERE p.id = ? AND p.deleted_at IS NULL', (post_id,))
+        post = c.fetchone()
     return post
 
 
+@metrics.timed('db.posts.update_post')
 def update_post(post_id: int, title: str, content: Optional[Dict]) -> None:
-    import os
-    conn = _get_conn()
-    c = conn.cursor()
-    if content:
-        mdx_content = content.get('mdx')
-        thumbnail_bytes = content.get('thumbnail_bytes')
-        thumbnail_ext = content.get('thumbnail_ext')
-        c.execute('SELECT content, thumbnail FROM posts WHERE id = ?', (post_id,))
-        row = c.fetchone()
-        if row:
-            old_content_path, old_thumbnail_path = row
-            if mdx_content:
-                with open(os.path.join(os.path.dirname(__file__), old_content_path), 'w', encoding='utf-8') as f:
-                    f.write(mdx_content)
-            if thumbnail_bytes and thumbnail_ext:
-                thumbnail_path = os.path.join(os.path.dirname(__file__), old_thumbnail_path)
-                with open(thumbnail_path, 'wb') as f:
-                    f.write(thumbnail_bytes)
-        c.execute('UPDATE posts SET title = ? WHERE id = ?', (title, post_id))
-    else:
-        c.execute('UPDATE posts SET title = ? WHERE id = ?', (title, post_id))
-    conn.commit()
-    conn.close()
+    """Update a post's title and, optionally, its MDX body and thumbnail.
+
+    New bodies/thumbnails are stored under fresh refs and the row is repointed
+    at them, so a published media URL never changes content (the media route
+    serves UUID-named and hash-named files as immutable).
+    """
+    storage = post_storage.get_storage()
+    new_refs = []
+    stale_refs = []
+    body = None
+    try:
+        with _get_conn() as conn:
+            c = conn.cursor()
+            if content:
+                mdx_content = content.get('mdx')
+                thumbnail_bytes = content.get('thumbnail_bytes')
+                thumbnail_ext = content.get('thumbnail_ext')
+                c.execute('SELECT content, thumbnail FROM posts WHERE id = ? AND deleted_at IS NULL', (post_id,))
+                row = c.fetchone()
+                if row:
+                    old_content_ref, old_thumbnail_ref = row
+                    body = mdx_content
+                    if mdx_content:
+                        ref = storage.put(conn, mdx_content.encode('utf-8'), '.mdx')
+                        new_refs.append(ref)
+                        c.execute('UPDATE posts SET content = ?, excerpt = ? WHERE id = ?',
+                                  (ref, _excerpt(mdx_content), post_id))
+                        post_storage.release(conn, old_content_ref)
+                        stale_refs.append(old_content_ref)
+                    if thumbnail_bytes and thumbnail_ext:
+                        ref = storage.put(conn, thumbnail_bytes, thumbnail_ext)
+                        new_refs.append(ref)
+                        # The placeholder follows once the new derivatives exist
+                        c.execute('UPDATE posts SET thumbnail = ?, placeholder = NULL WHERE id = ?', (ref, post_id))
+                        post_storage.release(conn, old_thumbnail_ref)
+                        stale_refs.append(old_thumbnail_ref)
+            c.execute('UPDATE posts SET title = ?, updated_at = ?, change_seq = ? '
+                      'WHERE id = ? AND deleted_at IS NULL',
+                      (title, _now(), _next_change_seq(conn), post_id))
+            if c.rowcount:
+                _reindex_post(conn, post_id, body)
+    except Exception:
+        for ref in new_refs:
+            post_storage.purge(ref)
+        raise
+    post_cache.invalidate(post_id)
+    if new_refs:
+        _process_in_background([post_id])
+    # Old files are only removed once the row points at the new ones
+    for ref in stale_refs:
+        post_storage.purge(ref)
 
 
+def _reindex_post(conn: sqlite3.Connection, post_id: int, mdx: Optional[str] = None) -> None:
+    """Refresh the search index entry of a post from its current row."""
+    row = conn.execute('SELECT title, author, content FROM posts WHERE id = ?', (post_id,)).fetchone()
+    if row is None:
+        post_search.unindex_post(conn, post_id)
+        return
+    title, author, content_ref = row
+    if not mdx:
+        mdx = post_storage.read_text(content_ref)
+    post_search.index_post(conn, post_id, title, author, mdx)
+
+
+@metrics.timed('db.posts.delete_post')
 def delete_post(post_id: int) -> bool:
-    import os
-    conn = _get_conn()
-    c = conn.cursor()
-    c.execute('SELECT content, thumbnail FROM posts WHERE id = ?', (post_id,))
-    row = c.fetchone()
-    if row:
-        content_path, thumbnail_path = row
+    """Delete a post's files and turn its row into a tombstone (id plus
+    deletion time and change number) so syncing clients learn about it."""
+    with _get_conn() as conn:
+        c = conn.cursor()
+        c.execute('SELECT content, thumbnail FROM posts WHERE id = ? AND deleted_at IS NULL', (post_id,))
+        row = c.fetchone()
+        if row is None:
+            return False
+        affected = _tombstone(conn, post_id, row, _now(), _next_change_seq(conn))
+    post_cache.invalidate(post_id)
+    # Remove files after commit; each one independently, failures are logged
+    for ref in row:
+        post_storage.purge(ref)
+    return affected > 0
+
+
+def _tombstone(conn: sqlite3.Connection, post_id: int, refs: Tuple[str, ...], now: str, seq: int) -> int:
+    """Blank a post row into a tombstone and release its files (the caller
+    purges them after commit). Returns the number of rows changed."""
+    affected = conn.execute(
+        "UPDATE posts SET title = '', content = '', thumbnail = '', excerpt = NULL, placeholder = NULL, "
+        "deleted_at = ?, updated_at = ?, change_seq = ? WHERE id = ?",
+        (now, now, seq, post_id),
+    ).rowcount
+    post_search.unindex_post(conn, post_id)
+    for ref in refs:
+        post_storage.release(conn, ref)
+    return affected
+
+
+@metrics.timed('db.posts.delete_user_and_posts')
+def delete_user_and_posts(user_id: int) -> bool:
+    """Delete a user and every post linked to them (as tombstones) in one
+    transaction over posts.db and the attached users.db. Returns False when
+    the user didn't exist (their remaining posts are still deleted).
+
+    In WAL mode SQLite commits each attached file atomically but not the two
+    together; after a crash mid-commit, calling this again finishes the job.
+    users.db is only locked by the final DELETE, not while posts are written.
+    """
+    with _get_conn() as conn:
+        begin_write(conn, 'sync_state')
+        rows = conn.execute('SELECT id, content, thumbnail FROM posts WHERE author_id = ? AND deleted_at IS NULL',
+                            (user_id,)).fetchall()
+        if rows:
+            first_seq = _next_change_seq(conn, len(rows)) - len(rows) + 1
+            now = _now()
+            for i, (post_id, content_ref, thumbnail_ref) in enumerate(rows):
+                _tombstone(conn, post_id, (content_ref, thumbnail_ref), now, first_seq + i)
+        deleted = conn.execute('DELETE FROM users.users WHERE id = ?', (user_id,)).rowcount
+    user_cache.invalidate(user_id)
+    for post_id, content_ref, thumbnail_ref in rows:
+        post_cache.invalidate(post_id)
+        post_storage.purge(content_ref)
+        post_storage.purge(thumbnail_ref)
+    return deleted > 0
+
+
+def store_placeholder(thumbnail_ref: str, placeholder: Optional[str]) -> List[int]:
+    """Record the placeholder of a thumbnail on the live posts showing it,
+    once its derivatives exist. Posts whose placeholder changes get new
+    change numbers, so feed ETags and syncing clients pick it up. Returns
+    their ids."""
+    if not thumbnail_ref or not placeholder:
+        return []
+    with _get_conn() as conn:
+        begin_write(conn, 'sync_state')
+        post_ids = [r[0] for r in conn.execute(
+            'SELECT id FROM posts WHERE thumbnail = ? AND deleted_at IS NULL AND placeholder IS NOT ?',
+            (thumbnail_ref, placeholder))]
+        if post_ids:
+            first_seq = _next_change_seq(conn, len(post_ids)) - len(post_ids) + 1
+            now = _now()
+            for i, post_id in enumerate(post_ids):
+                conn.execute('UPDATE posts SET placeholder = ?, updated_at = ?, change_seq = ? WHERE id = ?',
+                             (placeholder, now, first_seq + i, post_id))
+    for post_id in post_ids:
+        post_cache.invalidate(post_id)
+    return post_ids
+
+
+def mark_author_changed(user_id: int) -> int:
+    """Copy `user_id`'s current name onto their posts after a rename, so the
+    stored author that `author=` filters and search match is the name the
+    posts show. The posts get new change numbers and cached bodies are
+    dropped, so feed ETags and syncing clients pick up the new name.
+    Returns the count."""
+    with _get_conn() as conn:
+        begin_write(conn, 'sync_state')
+        rows = conn.execute('SELECT p.id, u.name FROM posts p JOIN users.users u ON u.id = p.author_id '
+                            'WHERE p.author_id = ? AND p.deleted_at IS NULL', (user_id,)).fetchall()
+        _set_author(conn, rows)
+    for post_id, _ in rows:
+        post_cache.invalidate(post_id)
+    return len(rows)
+
+
+@metrics.timed('db.posts.get_changes')
+def get_changes(since: int, limit: int) -> Tuple[List[tuple], int, bool]:
+    """Posts written or deleted after change number `since`, oldest change
+    first, as standard post rows (see POST_COLUMNS) followed by updated_at,
+    deleted_at and change_seq. `since=0` returns the live posts only.
+
+    Also returns the latest change number and whether the client has to
+    resync from scratch: `since` is older than the pruned tombstones, or
+    newer than the latest change (the database was reset or restored from a
+    backup, so the token means nothing here). Both reads share one snapshot,
+    so nothing committed in between is skipped.
+    """
+    with _get_conn() as conn:
+        conn.execute('BEGIN')
+        seq, pruned_seq = conn.execute('SELECT seq, pruned_seq FROM sync_state WHERE id = 1').fetchone()
+        if since > seq or 0 < since < pruned_seq:
+            return [], seq, True
+        query = (f'SELECT {POST_COLUMNS}, p.updated_at, p.deleted_at, p.change_seq '
+                 f'FROM {POSTS_WITH_AUTHOR} WHERE p.change_seq > ?')
+        if since == 0:
+            query += ' AND p.deleted_at IS NULL'
+        rows = conn.execute(query + ' ORDER BY p.change_seq LIMIT ?', (since, limit)).fetchall()
+    return rows, seq, False
+
+
+def prune_tombstones(older_than_days: float) -> int:
+    """Drop tombstones of posts deleted more than `older_than_days` ago.
+    Clients whose sync token predates them are told to resync. Returns the
+    number of tombstones removed."""
+    cutoff = (datetime.datetime.now(datetime.timezone.utc)
+              - datetime.timedelta(days=older_than_days)).isoformat(timespec='milliseconds')
+    with _get_conn() as conn:
+        row = conn.execute(
+            'SELECT COUNT(*), MAX(change_seq) FROM posts WHERE deleted_at IS NOT NULL AND deleted_at < ?',
+            (cutoff,),
+        ).fetchone()
+        if not row[0]:
+            return 0
+        conn.execute('DELETE FROM posts WHERE deleted_at IS NOT NULL AND deleted_at < ?', (cutoff,))
+        conn.execute('UPDATE sync_state SET pruned_seq = MAX(pruned_seq, ?) WHERE id = 1', (row[1],))
+    return row[0]
+
+
+def migrate_storage(target: str) -> int:
+    """Move every post's body and thumbnail into the `target` backend
+    ('fs' or 'db'). Each post is moved in its own transaction. Returns the
+    number of posts migrated.
+    """
+    storage = post_storage.get_storage(target)
+    with _get_conn() as conn:
+        rows = conn.execute('SELECT id, content, thumbnail FROM posts WHERE deleted_at IS NULL ORDER BY id').fetchall()
+    moved = 0
+    for post_id, content_ref, thumbnail_ref in rows:
+        updates = {}
+        for column, ref in (('content', content_ref), ('thumbnail', thumbnail_ref)):
+            if post_storage.storage_for_ref(ref) is storage:
+                continue
+            data = post_storage.read_bytes(ref)
+            if data is None:
+                continue
+            updates[column] = (ref, data, os.path.splitext(post_storage.media_name(ref))[1])
+        if not updates:
+            continue
+        new_refs = []
         try:
-            os.remove(os.path.join(os.path.dirname(__file__), content_path))
-            os.remove(os.path.join(os.path.dirname(__file__), thumbnail_path))
+            with _get_conn() as conn:
+                for column, (old_ref, data, ext) in updates.items():
+                    new_ref = storage.put(conn, data, ext)
+                    new_refs.append(new_ref)
+                    conn.execute(f'UPDATE posts SET {column} = ? WHERE id = ?', (new_ref, post_id))
+                    post_storage.release(conn, old_ref)
         except Exception:
-            pass
-    c.execute('DELETE FROM posts WHERE id = ?', (post_id,))
-    conn.commit()
-    affected = c.rowcount
-    conn.close()
-    return affected > 0
\ No newline at end of file
+            for ref in new_refs:
+                post_storage.purge(ref)
+            raise
+        post_cache.invalidate(post_id)
+        for old_ref, _, _ in updates.values():
+            post_storage.purge(old_ref)
+        moved += 1
+    return moved
+
+
+@metrics.timed('db.posts.search_posts')
+def search_posts(query: str, limit: int, offset: int = 0) -> List[tuple]:
+    """Full-text search. Returns standard post rows (see POST_COLUMNS) plus
+    highlighted_title and snippet, best match first."""
+    match = post_search.to_match_query(query)
+    if match is None:
+        return []
+    with _get_conn() as conn:
+        hits = post_search.search(conn, match, limit, offset)
+        if not hits:
+            return []
+        ids = [h[0] for h in hits]
+        placeholders = ','.join('?' * len(ids))
+        rows = conn.execute(
+            f'SELECT {POST_COLUMNS} FROM {POSTS_WITH_AUTHOR} '
+            f'WHERE p.id IN ({placeholders}) AND p.deleted_at IS NULL',
+            ids,
+        ).fetchall()
+    by_id = {r[0]: r for r in rows}
+    return [by_id[pid] + (title_hl, snippet) for pid, title_hl, snippet, _ in hits if pid in by_id]
+
+
+def rebuild_search_index() -> int:
+    """Re-index every post from scratch. Returns the number of posts indexed."""
+    with _get_conn() as conn:
+        rows = conn.execute(
+            'SELECT id, title, author, content FROM posts WHERE deleted_at IS NULL ORDER BY id'
+        ).fetchall()
+        post_search.clear_index(conn)
+        post_search.index_posts(conn, (
+            (pid, title, author, post_storage.read_text(content_ref))
+            for pid, title, author, content_ref in rows
+        ))
+    return len(rows)
+
+
+def rerender_posts() -> int:
+    """Render every post body with the current renderer (see mdx_render)."""
+    return mdx_render.rerender_all(post_storage.read_text(row[3]) for row in iter_posts())
\ No newline at end of file
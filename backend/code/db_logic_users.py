@@ -1,23 +1,38 @@
+import json
 import os
-import sqlite3
 from typing import Optional, Dict
 
-from argon2 import PasswordHasher  # type: ignore
-from argon2.exceptions import VerifyMismatchError  # type: ignore
+import metrics
+import migrations
+from db_pool import get_pool
+from passwords import hash_password, verify_and_upgrade
+from post_cache import LRUCache
 
 # Use the db/ folder for the SQLite database, regardless of current working dir
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "db", "users.db"))
+# (DB_DIR overrides it, e.g. for benchmarks on a scratch database)
+DB_DIR = os.environ.get("DB_DIR") or os.path.join(os.path.dirname(__file__), "..", "db")
+DB_PATH = os.path.abspath(os.path.join(DB_DIR, "users.db"))
+
+# Profiles ({id, name, email}) of authenticated users, so token checks don't
+# hit SQLite on every request. Writes here invalidate; the TTL bounds how long
+# other worker processes may serve a stale profile.
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "4096"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+user_cache = LRUCache(max_entries=USER_CACHE_MAX_ENTRIES, max_bytes=USER_CACHE_MAX_ENTRIES * 512,
+                      ttl=USER_CACHE_TTL_SECONDS)
 
 
 def _get_conn():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+    """Borrow a pooled connection (use as a context manager)."""
+    return get_pool(DB_PATH).connection()
+
+
+migrations.database('users', _get_conn)
 
 
-def create_table():
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
+@migrations.migration('users', 1, 'users table')
+def _create_users_table(conn):
+    conn.execute(
         """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -27,119 +42,165 @@ def create_table():
         )
         """
     )
-    conn.commit()
-    conn.close()
 
 
+@metrics.timed('db.users.check_user_exists')
 def check_user_exists(email: str) -> bool:
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id FROM users WHERE email = ?
-        """,
-        (email,),
-    )
-    user = cursor.fetchone()
-    conn.close()
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id FROM users WHERE email = ?
+            """,
+            (email,),
+        )
+        user = cursor.fetchone()
     return user is not None
 
 
+@metrics.timed('db.users.add_user')
 def add_user(name: str, email: str, password: str) -> int:
-    ph = PasswordHasher()
-    hashed_password = ph.hash(password)
-
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO users (name, email, password)
-        VALUES (?, ?, ?)
-        """,
-        (name, email, hashed_password),
-    )
-    conn.commit()
-    user_id = cursor.lastrowid
-    conn.close()
+    hashed_password = hash_password(password)
+
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO users (name, email, password)
+            VALUES (?, ?, ?)
+            """,
+            (name, email, hashed_password),
+        )
+        user_id = cursor.lastrowid
     return int(user_id) if user_id is not None else -1
 
 
+@metrics.timed('db.users.get_user')
 def get_user(user_id: int) -> Optional[Dict[str, str]]:
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, name, email FROM users WHERE id = ?
-        """,
-        (user_id,),
-    )
-    user = cursor.fetchone()
-    conn.close()
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, name, email FROM users WHERE id = ?
+            """,
+            (user_id,),
+        )
+        user = cursor.fetchone()
     if user:
         return {"id": user[0], "name": user[1], "email": user[2]}
     return None
 
 
+def get_user_cached(user_id: int) -> Optional[Dict[str, str]]:
+    """`get_user` through the profile cache. Missing users are not cached."""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        metrics.inc('blog_user_profile_lookups_total', source='cache')
+        return json.loads(cached)
+    generation = user_cache.generation(user_id)
+    metrics.inc('blog_user_profile_lookups_total', source='db')
+    user = get_user(user_id)
+    if user:
+        user_cache.put(user_id, None, json.dumps(user).encode('utf-8'), generation=generation)
+    return user
+
+
+@metrics.timed('db.users.update_user')
+def update_user(user_id: int, name: Optional[str] = None, email: Optional[str] = None) -> bool:
+    """Change a user's name and/or email. Returns False if the user doesn't
+    exist; raises sqlite3.IntegrityError if the email is already taken."""
+    fields = []
+    params = []
+    if name is not None:
+        fields.append("name = ?")
+        params.append(name)
+    if email is not None:
+        fields.append("email = ?")
+        params.append(email)
+    if not fields:
+        return get_user(user_id) is not None
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            UPDATE users SET {', '.join(fields)} WHERE id = ?
+            """,
+            (*params, user_id),
+        )
+    user_cache.invalidate(user_id)
+    return cursor.rowcount > 0
+
+
+@metrics.timed('db.users.get_user_by_email')
 def get_user_by_email(email: str) -> Optional[Dict[str, str]]:
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, name, email FROM users WHERE email = ?
-        """,
-        (email,),
-    )
-    user = cursor.fetchone()
-    conn.close()
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, name, email FROM users WHERE email = ?
+            """,
+            (email,),
+        )
+        user = cursor.fetchone()
     if user:
         return {"id": user[0], "name": user[1], "email": user[2]}
     return None
 
 
+@metrics.timed('db.users.verify_credentials')
 def verify_credentials(email: str, password: str) -> Optional[Dict[str, str]]:
-    """Return user dict if credentials are valid, else None."""
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, name, email, password FROM users WHERE email = ?
-        """,
-        (email,),
-    )
-    row = cursor.fetchone()
-    conn.close()
+    """Return user dict if credentials are valid, else None.
+
+    May raise passwords.HashingBusy when the hashing queue is saturated."""
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, name, email, password FROM users WHERE email = ?
+            """,
+            (email,),
+        )
+        row = cursor.fetchone()
     if not row:
         return None
     user_id, name, email, hashed = row
-    ph = PasswordHasher()
-    try:
-        if ph.verify(hashed, password):
-            return {"id": user_id, "name": name, "email": email}
-    except VerifyMismatchError:
+    ok, new_hash = verify_and_upgrade(hashed, password)
+    if not ok:
         return None
-    return None
-
+    if new_hash:
+        # Transparently upgrade hashes made with older Argon2 parameters
+        with _get_conn() as conn:
+            conn.execute(
+                """
+                UPDATE users SET password = ? WHERE id = ? AND password = ?
+                """,
+                (new_hash, user_id, hashed),
+            )
+    user = {"id": user_id, "name": name, "email": email}
+    # The client's next call is usually /api/auth/check; have the profile ready
+    user_cache.put(user_id, None, json.dumps(user).encode('utf-8'))
+    return user
+
+@metrics.timed('db.users.delete_user')
 def delete_user(user_id: int) -> bool:
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        DELETE FROM users WHERE id = ?
-        """,
-        (user_id,),
-    )
-    conn.commit()
-    conn.close()
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM users WHERE id = ?
+            """,
+            (user_id,),
+        )
+    user_cache.invalidate(user_id)
     return cursor.rowcount > 0
 
 def clear_users() -> bool:
-    conn = _get_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        DELETE FROM users
-        """
-    )
-    conn.commit()
-    conn.close()
+    with _get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM users
+            """
+        )
+    user_cache.clear()
     return cursor.rowcount > 0
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Connection tuning, overridable from the environment
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+STATEMENT_CACHE_SIZE = int(os.environ.get("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+POOL_MAX_IDLE = int(os.environ.get("SQLITE_POOL_MAX_IDLE", "8"))
+
+
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections for one database file.
+
+    Connections are configured once when opened (WAL, synchronous=NORMAL,
+    busy_timeout, mmap) and handed out LIFO so the warmest connection, and its
+    prepared statement cache, is reused first. Idle connections beyond
+    `max_idle` are closed instead of returned. `attach` maps schema names to
+    other database files ATTACHed to every connection, for cross-file joins.
+    """
+
+    def __init__(self, db_path: str, max_idle: int = POOL_MAX_IDLE, attach: Optional[Dict[str, str]] = None):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.attach = dict(attach or {})
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats = {"opened": 0, "reused": 0, "closed": 0, "in_use": 0}
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000.0,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        for schema, path in self.attach.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        return conn
+
+    def _check_fork(self) -> None:
+        # Connections must not cross a fork (e.g. gunicorn --preload)
+        if self._pid != os.getpid():
+            self._idle = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+            self._stats["in_use"] = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self._check_fork()
+            self._stats["in_use"] += 1
+            if self._idle:
+                self._stats["reused"] += 1
+                return self._idle.pop()
+            self._stats["opened"] += 1
+        return self._open()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._stats["closed"] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; commits on success, rolls back on error."""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._stats["closed"] += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), max_idle=self.max_idle)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def begin_write(conn: sqlite3.Connection, table: str) -> None:
+    """Start a transaction holding the write lock of the connection's main
+    database, like BEGIN IMMEDIATE. That statement would also lock every
+    ATTACHed file, so instead the lock is taken by a write to `table` (in
+    main) that changes nothing; attached files are only locked once the
+    transaction itself writes to them."""
+    conn.execute("BEGIN")
+    conn.execute(f"DELETE FROM main.{table} WHERE 0")
+
+
+def get_pool(db_path: str, attach: Optional[Dict[str, str]] = None) -> ConnectionPool:
+    """Return the process-wide pool for `db_path`, creating it on first use
+    (`attach` only matters then: pass the same mapping every time)."""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = _pools[db_path] = ConnectionPool(db_path, attach=attach)
+    return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Stats for every pool, keyed by database file name (for monitoring)."""
+    return {os.path.basename(path): pool.stats() for path, pool in list(_pools.items())}
+
+
+def close_all_pools() -> None:
+    for pool in list(_pools.values()):
+        pool.close_all()
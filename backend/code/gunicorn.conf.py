@@ -0,0 +1,43 @@
+"""gunicorn settings for `flask --app app serve` (or `gunicorn -c gunicorn.conf.py app:app`).
+
+Defaults derive from the CPU count and can be overridden from the
+environment. The app is preloaded in the master, which checks the schema
+version (see app.init_db and migrations.py) once before forking, so workers
+never race on schema setup; each worker then starts its own background job
+threads.
+"""
+import multiprocessing
+import os
+
+_cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '3000')}")
+# Requests mostly wait on SQLite and file I/O, so threaded workers go further
+# than one process per request: 2 processes per core (max 8), 4 threads each
+workers = int(os.environ.get("WEB_CONCURRENCY", str(min(2 * _cpus, 8) or 2)))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+# Heartbeat files on tmpfs: a slow disk can't make healthy workers look dead
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def on_starting(server):
+    import app
+    app.init_db()
+
+
+def post_worker_init(worker):
+    import jobs
+    import passwords
+    passwords.configure(worker.cfg.workers, worker.cfg.threads)
+    jobs.start()
@@ -0,0 +1,250 @@
+"""In-process background jobs backed by an SQLite table.
+
+Work that doesn't have to finish before a request returns (rendering post
+bodies, thumbnail derivatives, seeding) is recorded in ``db/jobs.db`` with
+`enqueue` and run by a few worker threads in the same process. Jobs survive
+restarts, failures are retried with exponential backoff up to
+`max_attempts`, and clients can poll ``GET /api/jobs/<id>``. No external
+broker is needed; several processes can share the table because a job is
+claimed with a single atomic UPDATE.
+
+Handlers are plain functions registered with `@handler("kind")`; they get the
+JSON payload and may return a JSON-serializable result.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import migrations
+from db_pool import get_pool
+
+DB_DIR = os.environ.get("DB_DIR") or os.path.join(os.path.dirname(__file__), '..', 'db')
+DB_PATH = os.path.abspath(os.path.join(DB_DIR, 'jobs.db'))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "2"))  # seconds, doubled per attempt
+# Idle workers re-check the table this often (picks up other processes' jobs)
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+# Finished jobs older than this are deleted
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+logger = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable[[Dict], object]] = {}
+_workers: List[threading.Thread] = []
+_workers_pid: Optional[int] = None
+_start_lock = threading.Lock()
+_stop = threading.Event()
+_wakeup = threading.Condition()
+
+
+def _get_conn():
+    """Borrow a pooled connection (use as a context manager)."""
+    return get_pool(DB_PATH).connection()
+
+
+migrations.database('jobs', _get_conn)
+
+
+@migrations.migration('jobs', 1, 'jobs table')
+def _create_jobs_table(conn) -> None:
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)')
+
+
+def handler(kind: str):
+    """Register the function that runs jobs of `kind`."""
+    def register(fn: Callable[[Dict], object]) -> Callable[[Dict], object]:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind: str, payload: Optional[Dict] = None, max_attempts: int = JOB_MAX_ATTEMPTS,
+            delay: float = 0.0) -> int:
+    """Record a job and wake a worker. Returns the job id."""
+    now = time.time()
+    with _get_conn() as conn:
+        cur = conn.execute(
+            'INSERT INTO jobs (kind, payload, status, max_attempts, run_after, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (kind, json.dumps(payload or {}), QUEUED, max(1, max_attempts), now + delay, now, now),
+        )
+        job_id = int(cur.lastrowid)
+    # Workers of this process pick it up now, others on their next poll
+    with _wakeup:
+        _wakeup.notify()
+    return job_id
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    with _get_conn() as conn:
+        row = conn.execute(
+            'SELECT id, kind, status, attempts, max_attempts, result, error, created_at, updated_at '
+            'FROM jobs WHERE id = ?',
+            (job_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    jid, kind, status, attempts, max_attempts, result, error, created_at, updated_at = row
+    return {
+        'id': jid,
+        'kind': kind,
+        'status': status,
+        'attempts': attempts,
+        'max_attempts': max_attempts,
+        'result': json.loads(result) if result else None,
+        'error': error,
+        'created_at': created_at,
+        'updated_at': updated_at,
+    }
+
+
+def _claim() -> Optional[tuple]:
+    now = time.time()
+    with _get_conn() as conn:
+        return conn.execute(
+            '''
+            UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs WHERE status = ? AND run_after <= ?
+                ORDER BY run_after, id LIMIT 1
+            ) AND status = ?
+            RETURNING id, kind, payload, attempts, max_attempts
+            ''',
+            (RUNNING, now, QUEUED, now, QUEUED),
+        ).fetchone()
+
+
+def _finish(job_id: int, result: object) -> None:
+    with _get_conn() as conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?',
+            (DONE, json.dumps(result), time.time(), job_id),
+        )
+
+
+def _fail(job_id: int, attempts: int, max_attempts: int, error: str) -> None:
+    now = time.time()
+    retry = attempts < max_attempts
+    with _get_conn() as conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, error = ?, run_after = ?, updated_at = ? WHERE id = ?',
+            (QUEUED if retry else FAILED, error,
+             now + JOB_RETRY_DELAY * (2 ** (attempts - 1)) if retry else now, now, job_id),
+        )
+
+
+def run_one() -> bool:
+    """Claim and run a single due job. Returns False when none was due."""
+    claimed = _claim()
+    if claimed is None:
+        return False
+    job_id, kind, payload, attempts, max_attempts = claimed
+    fn = _handlers.get(kind)
+    if fn is None:
+        _fail(job_id, max_attempts, max_attempts, f"No handler for job kind '{kind}'")
+        return True
+    try:
+        result = fn(json.loads(payload))
+    except Exception as e:
+        logger.warning("Job %d (%s) failed on attempt %d/%d", job_id, kind, attempts, max_attempts,
+                       exc_info=True)
+        _fail(job_id, attempts, max_attempts, f"{type(e).__name__}: {e}")
+    else:
+        _finish(job_id, result)
+    return True
+
+
+def _worker() -> None:
+    while not _stop.is_set():
+        try:
+            if run_one():
+                continue
+        except Exception:
+            # e.g. the database is locked for longer than busy_timeout
+            logger.warning("Job worker error", exc_info=True)
+        with _wakeup:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+
+
+def recover() -> None:
+    """Requeue jobs left running by a process that died and drop old ones.
+    Call once per deployment start, before workers are forked."""
+    now = time.time()
+    with _get_conn() as conn:
+        conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?', (QUEUED, now, RUNNING))
+        conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                     (DONE, FAILED, now - JOB_RETENTION_SECONDS))
+
+
+def start(workers: int = JOB_WORKERS) -> None:
+    """Start the worker threads of this process (idempotent, fork-aware:
+    threads don't survive a fork, so each worker process starts its own).
+    Cheap once started: the app calls it before every request."""
+    global _workers_pid
+    # Unlocked fast path; the check is repeated under the lock
+    if _workers_pid == os.getpid() or workers <= 0:
+        return
+    with _start_lock:
+        if _workers_pid == os.getpid() or workers <= 0:
+            return
+        _stop.clear()
+        _workers.clear()
+        for i in range(workers):
+            t = threading.Thread(target=_worker, name=f"jobs-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+        _workers_pid = os.getpid()
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """Stop the workers, letting running jobs finish. Queued jobs stay in the
+    table and run after the next start."""
+    global _workers_pid
+    with _start_lock:
+        if _workers_pid != os.getpid():
+            return
+        _stop.set()
+        with _wakeup:
+            _wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for t in _workers:
+            t.join(max(0.0, deadline - time.monotonic()))
+        _workers.clear()
+        _workers_pid = None
+
+
+atexit.register(shutdown)
+
+
+def job_stats() -> Dict[str, object]:
+    with _get_conn() as conn:
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+    return {
+        'workers': len(_workers) if _workers_pid == os.getpid() else 0,
+        'handlers': sorted(_handlers),
+        **{s: counts.get(s, 0) for s in (QUEUED, RUNNING, DONE, FAILED)},
+    }
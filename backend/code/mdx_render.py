@@ -0,0 +1,276 @@
+"""Server-side rendering of post MDX to HTML or a JSON AST.
+
+The renderer covers the markdown subset the app writes (headings, paragraphs,
+lists, block quotes, fenced code, rules, emphasis, inline code, links and
+images); MDX `import`/`export` lines and JSX tags are dropped. Results are
+written once per body under RENDERED_DIR (default: ``rendered/`` next to
+POSTS_DIR, outside the tree /media/posts serves) keyed by the SHA-256 of the
+MDX and RENDERER_VERSION, so unchanged bodies are never rendered twice and a
+renderer upgrade simply misses the old artifacts.
+"""
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from post_storage import POSTS_DIR
+
+# Bump whenever the output changes; stale artifacts are re-rendered
+RENDERER_VERSION = 1
+RENDERED_DIR = os.path.abspath(os.environ.get("RENDERED_DIR") or os.path.join(os.path.dirname(POSTS_DIR), 'rendered'))
+if os.path.commonpath([RENDERED_DIR, POSTS_DIR]) == POSTS_DIR:
+    raise RuntimeError("RENDERED_DIR must be outside POSTS_DIR (its files are served publicly)")
+# Where artifacts used to be written; removed by the next rerender_all
+_LEGACY_RENDERED_DIR = os.path.join(POSTS_DIR, 'rendered')
+FORMATS = ('html', 'ast')
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r'^\s*```\s*([\w+-]*)\s*$')
+_HEADING_RE = re.compile(r'^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$')
+_HR_RE = re.compile(r'^\s{0,3}([-*_])(\s*\1){2,}\s*$')
+_QUOTE_RE = re.compile(r'^\s{0,3}>\s?(.*)$')
+_UL_RE = re.compile(r'^\s*[-*+]\s+(.*)$')
+_OL_RE = re.compile(r'^\s*\d+[.)]\s+(.*)$')
+_MDX_LINE_RE = re.compile(r'^\s*(import|export)\s')
+_JSX_LINE_RE = re.compile(r'^\s*</?[A-Z][^>]*>\s*$')
+_INLINE_RE = re.compile(
+    r'(?P<code>`[^`]+`)'
+    r'|(?P<image>!\[(?P<alt>[^\]]*)\]\((?P<src>[^)\s]+)\))'
+    r'|(?P<link>\[(?P<label>[^\]]+)\]\((?P<href>[^)\s]+)\))'
+    r'|(?P<strong>(\*\*|__)(?P<strong_text>.+?)(\*\*|__))'
+    r'|(?P<em>(\*|_)(?P<em_text>[^*_]+?)(\*|_))'
+)
+
+
+def parse_inline(text: str) -> List[Dict]:
+    nodes: List[Dict] = []
+    pos = 0
+    for m in _INLINE_RE.finditer(text):
+        if m.start() > pos:
+            nodes.append({'type': 'text', 'value': text[pos:m.start()]})
+        if m.group('code'):
+            nodes.append({'type': 'inlineCode', 'value': m.group('code')[1:-1]})
+        elif m.group('image'):
+            nodes.append({'type': 'image', 'alt': m.group('alt'), 'src': m.group('src')})
+        elif m.group('link'):
+            nodes.append({'type': 'link', 'href': m.group('href'), 'children': parse_inline(m.group('label'))})
+        elif m.group('strong'):
+            nodes.append({'type': 'strong', 'children': parse_inline(m.group('strong_text'))})
+        else:
+            nodes.append({'type': 'emphasis', 'children': parse_inline(m.group('em_text'))})
+        pos = m.end()
+    if pos < len(text):
+        nodes.append({'type': 'text', 'value': text[pos:]})
+    return nodes
+
+
+def parse(mdx: str) -> Dict:
+    """Parse MDX into a small mdast-like tree: {'type': 'root', 'children': [...]}."""
+    lines = (mdx or '').replace('\r\n', '\n').split('\n')
+    blocks: List[Dict] = []
+    paragraph: List[str] = []
+    i = 0
+
+    def flush_paragraph() -> None:
+        if paragraph:
+            blocks.append({'type': 'paragraph', 'children': parse_inline(' '.join(paragraph))})
+            paragraph.clear()
+
+    while i < len(lines):
+        line = lines[i]
+        fence = _FENCE_RE.match(line)
+        if fence:
+            flush_paragraph()
+            code: List[str] = []
+            i += 1
+            while i < len(lines) and not _FENCE_RE.match(lines[i]):
+                code.append(lines[i])
+                i += 1
+            blocks.append({'type': 'code', 'lang': fence.group(1) or None, 'value': '\n'.join(code)})
+            i += 1
+            continue
+        if not line.strip() or _MDX_LINE_RE.match(line) or _JSX_LINE_RE.match(line):
+            flush_paragraph()
+            i += 1
+            continue
+        heading = _HEADING_RE.match(line)
+        if heading:
+            flush_paragraph()
+            blocks.append({'type': 'heading', 'depth': len(heading.group(1)),
+                           'children': parse_inline(heading.group(2))})
+            i += 1
+            continue
+        if _HR_RE.match(line):
+            flush_paragraph()
+            blocks.append({'type': 'thematicBreak'})
+            i += 1
+            continue
+        if _QUOTE_RE.match(line):
+            flush_paragraph()
+            quoted = []
+            while i < len(lines) and _QUOTE_RE.match(lines[i]):
+                quoted.append(_QUOTE_RE.match(lines[i]).group(1))
+                i += 1
+            blocks.append({'type': 'blockquote', 'children': parse('\n'.join(quoted))['children']})
+            continue
+        list_re = _UL_RE if _UL_RE.match(line) else (_OL_RE if _OL_RE.match(line) else None)
+        if list_re is not None:
+            flush_paragraph()
+            items = []
+            while i < len(lines) and list_re.match(lines[i]):
+                items.append({'type': 'listItem', 'children': parse_inline(list_re.match(lines[i]).group(1))})
+                i += 1
+            blocks.append({'type': 'list', 'ordered': list_re is _OL_RE, 'children': items})
+            continue
+        paragraph.append(line.strip())
+        i += 1
+    flush_paragraph()
+    return {'type': 'root', 'children': blocks}
+
+
+_SAFE_URL_RE = re.compile(r'^(https?:|mailto:|/|#|\./|\.\./|[^:]*$)', re.IGNORECASE)
+
+
+def _url(value: str) -> str:
+    # Drop javascript: and other active schemes
+    return html.escape(value if _SAFE_URL_RE.match(value) else '#', quote=True)
+
+
+def _render_nodes(nodes: Iterable[Dict]) -> str:
+    return ''.join(_render_node(n) for n in nodes)
+
+
+def _render_node(node: Dict) -> str:
+    t = node['type']
+    if t == 'text':
+        return html.escape(node['value'], quote=False)
+    if t == 'inlineCode':
+        return f"<code>{html.escape(node['value'], quote=False)}</code>"
+    if t == 'image':
+        return f'<img src="{_url(node["src"])}" alt="{html.escape(node["alt"], quote=True)}">'
+    if t == 'link':
+        return f'<a href="{_url(node["href"])}">{_render_nodes(node["children"])}</a>'
+    if t == 'strong':
+        return f"<strong>{_render_nodes(node['children'])}</strong>"
+    if t == 'emphasis':
+        return f"<em>{_render_nodes(node['children'])}</em>"
+    if t == 'paragraph':
+        return f"<p>{_render_nodes(node['children'])}</p>"
+    if t == 'heading':
+        return f"<h{node['depth']}>{_render_nodes(node['children'])}</h{node['depth']}>"
+    if t == 'code':
+        lang = f' class="language-{html.escape(node["lang"], quote=True)}"' if node.get('lang') else ''
+        return f"<pre><code{lang}>{html.escape(node['value'], quote=False)}</code></pre>"
+    if t == 'thematicBreak':
+        return '<hr>'
+    if t == 'blockquote':
+        return f"<blockquote>{_render_nodes(node['children'])}</blockquote>"
+    if t == 'list':
+        tag = 'ol' if node['ordered'] else 'ul'
+        return f"<{tag}>{_render_nodes(node['children'])}</{tag}>"
+    if t == 'listItem':
+        return f"<li>{_render_nodes(node['children'])}</li>"
+    return _render_nodes(node.get('children', ()))
+
+
+def render_html(mdx: str) -> str:
+    return '\n'.join(_render_node(block) for block in parse(mdx)['children'])
+
+
+def content_hash(mdx: str) -> str:
+    return hashlib.sha256(mdx.encode('utf-8')).hexdigest()
+
+
+def _artifact_path(digest: str, fmt: str) -> str:
+    ext = 'html' if fmt == 'html' else 'json'
+    return os.path.join(RENDERED_DIR, f"{digest}.v{RENDERER_VERSION}.{ext}")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def ensure_rendered(mdx: Optional[str]) -> None:
+    """Write the HTML and AST artifacts for `mdx` unless they already exist."""
+    if not mdx:
+        return
+    digest = content_hash(mdx)
+    html_path, ast_path = _artifact_path(digest, 'html'), _artifact_path(digest, 'ast')
+    if os.path.exists(html_path) and os.path.exists(ast_path):
+        return
+    tree = parse(mdx)
+    _write_atomic(ast_path, json.dumps(tree, ensure_ascii=False, separators=(',', ':')))
+    _write_atomic(html_path, '\n'.join(_render_node(block) for block in tree['children']))
+
+
+def get_rendered(mdx: Optional[str], fmt: str):
+    """HTML string or AST dict for `mdx`, from the artifact cache when present
+    (rendered and stored on a miss)."""
+    if mdx is None:
+        return None
+    path = _artifact_path(content_hash(mdx), fmt)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        try:
+            ensure_rendered(mdx)
+        except OSError:
+            logger.warning("Could not store rendered post artifact", exc_info=True)
+            return render_html(mdx) if fmt == 'html' else parse(mdx)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    return text if fmt == 'html' else json.loads(text)
+
+
+def _version_marker() -> str:
+    return os.path.join(RENDERED_DIR, 'VERSION')
+
+
+def needs_rerender() -> bool:
+    try:
+        with open(_version_marker(), 'r', encoding='utf-8') as f:
+            return f.read().strip() != str(RENDERER_VERSION)
+    except OSError:
+        return True
+
+
+def rerender_all(bodies: Iterable[Optional[str]]) -> int:
+    """Render every body for the current version, drop artifacts that no
+    longer match a body or this version, and record the version. Returns the
+    number of bodies seen."""
+    count = 0
+    live = set()
+    for mdx in bodies:
+        count += 1
+        if not mdx:
+            continue
+        live.add(content_hash(mdx))
+        try:
+            ensure_rendered(mdx)
+        except Exception:
+            logger.warning("Failed to render a post", exc_info=True)
+    # Prune artifacts of older renderer versions and of deleted/edited bodies
+    suffix = f".v{RENDERER_VERSION}."
+    if os.path.isdir(RENDERED_DIR):
+        for name in os.listdir(RENDERED_DIR):
+            if name == 'VERSION' or name.endswith('.tmp'):
+                continue
+            if suffix not in name or name.split('.', 1)[0] not in live:
+                try:
+                    os.remove(os.path.join(RENDERED_DIR, name))
+                except OSError:
+                    pass
+    _write_atomic(_version_marker(), str(RENDERER_VERSION))
+    shutil.rmtree(_LEGACY_RENDERED_DIR, ignore_errors=True)
+    return count
@@ -0,0 +1,43 @@
+import re
+from typing import Optional
+
+# Patterns used to turn MDX/markdown into plain text (excerpts, search)
+_CODE_FENCE_RE = re.compile(r'```.*?```', re.DOTALL)
+_IMPORT_EXPORT_RE = re.compile(r'^\s*(import|export)\s.*$', re.MULTILINE)
+_JSX_TAG_RE = re.compile(r'</?[A-Za-z][^>]*>')
+_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_INLINE_CODE_RE = re.compile(r'`([^`]*)`')
+_HEADING_RE = re.compile(r'^\s{0,3}#{1,6}\s*', re.MULTILINE)
+_BLOCKQUOTE_RE = re.compile(r'^\s{0,3}>\s?', re.MULTILINE)
+_LIST_MARKER_RE = re.compile(r'^\s*([-*+]|\d+\.)\s+', re.MULTILINE)
+_EMPHASIS_RE = re.compile(r'(\*\*|__|\*|_|~~)(.+?)\1')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def strip_markdown(mdx: Optional[str]) -> str:
+    """Return the plain text of an MDX document (no markup, collapsed whitespace)."""
+    if not mdx:
+        return ''
+    text = _CODE_FENCE_RE.sub(' ', mdx)
+    text = _IMPORT_EXPORT_RE.sub(' ', text)
+    text = _JSX_TAG_RE.sub(' ', text)
+    text = _IMAGE_RE.sub(r'\1', text)
+    text = _LINK_RE.sub(r'\1', text)
+    text = _INLINE_CODE_RE.sub(r'\1', text)
+    text = _HEADING_RE.sub('', text)
+    text = _BLOCKQUOTE_RE.sub('', text)
+    text = _LIST_MARKER_RE.sub('', text)
+    text = _EMPHASIS_RE.sub(r'\2', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def make_excerpt(mdx: Optional[str], max_chars: int = 200) -> Optional[str]:
+    """Short plain-text preview of a post body, cut on a word boundary."""
+    if mdx is None:
+        return None
+    text = strip_markdown(mdx)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(' ', 1)[0] or text[:max_chars]
+    return cut.rstrip(' .,;:') + '…'
@@ -0,0 +1,231 @@
+"""Request timing, hot-path spans and Prometheus metrics.
+
+`span("db.posts.get_post")` (a context manager) and `@timed(...)` measure a
+piece of work; every measurement goes into a latency histogram (`inc` bumps
+a plain counter) and, while a
+request is being handled on the current thread, into that request's
+breakdown. app.py turns the breakdown into an optional ``Server-Timing``
+header and a sampled slow-request log line, and serves the histograms at
+``/api/metrics`` in Prometheus text format.
+
+With METRICS_ENABLED=0 `timed` returns the function unchanged and `span`
+returns a shared no-op context, so instrumentation costs next to nothing.
+Histograms are per process: under gunicorn each worker reports its own.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+METRICS_ENABLED = _env_flag("METRICS_ENABLED", "1")
+# Add a Server-Timing header with the span breakdown to every response
+SERVER_TIMING = _env_flag("SERVER_TIMING", "0")
+# Requests slower than this are logged with their breakdown...
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+# ...this fraction of the time (1 = always)
+SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get("SLOW_REQUEST_SAMPLE_RATE", "1"))
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+F = TypeVar("F", bound=Callable)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms keyed by metric name and a tuple of (label, value) pairs."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, metric: str, help_text: str) -> None:
+        self._help[metric] = help_text
+
+    def observe(self, metric: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        key = (metric, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, metric: str, labels: Tuple[Tuple[str, str], ...], amount: int = 1) -> None:
+        key = (metric, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """All counters and histograms in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(
+                ((m, l, list(h.counts), h.sum, h.count) for (m, l), h in self._histograms.items()),
+                key=lambda item: (item[0], item[1]),
+            )
+            counters = sorted(self._counters.items())
+        lines = []
+        current = None
+        for (metric, labels), value in counters:
+            if metric != current:
+                current = metric
+                if metric in self._help:
+                    lines.append(f"# HELP {metric} {self._help[metric]}")
+                lines.append(f"# TYPE {metric} counter")
+            base = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f'{metric}{{{base}}} {value}' if base else f'{metric} {value}')
+        for metric, labels, counts, total, count in items:
+            if metric != current:
+                current = metric
+                if metric in self._help:
+                    lines.append(f"# HELP {metric} {self._help[metric]}")
+                lines.append(f"# TYPE {metric} histogram")
+            base = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+            sep = ',' if base else ''
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{{{base}{sep}le="{le}"}} {cumulative}')
+            suffix = f'{{{base}}}' if base else ''
+            lines.append(f'{metric}_sum{suffix} {total:.6f}')
+            lines.append(f'{metric}_count{suffix} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+registry.describe('blog_request_duration_seconds', 'HTTP request latency by route.')
+registry.describe('blog_user_profile_lookups_total', 'Profile lookups for authenticated requests, by source (cache or db).')
+registry.describe('blog_rate_limit_requests_total', 'Requests checked by the rate limiter, by policy and outcome.')
+registry.describe('blog_span_duration_seconds', 'Latency of instrumented operations (DB, file I/O, encoding, hashing).')
+
+# Span totals of the request being handled on this thread, or None outside requests
+_local = threading.local()
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.start
+        registry.observe('blog_span_duration_seconds', (('span', self.name),), elapsed)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans[self.name] = spans.get(self.name, 0.0) + elapsed
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as `name`."""
+    return _Span(name) if METRICS_ENABLED else _NOOP
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator timing every call of the function as `name`."""
+    def decorate(fn: F) -> F:
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper  # type: ignore
+    return decorate
+
+
+def inc(metric: str, **labels: str) -> None:
+    """Increment the counter `metric` (no-op when metrics are disabled)."""
+    if METRICS_ENABLED:
+        registry.inc(metric, tuple(sorted(labels.items())))
+
+
+def collect_spans(fn: Callable, *args) -> Tuple[object, Dict[str, float]]:
+    """Run fn(*args) on a worker thread and return (result, span totals of
+    the call), for the request thread to fold in with add_spans()."""
+    _local.spans = {}
+    try:
+        return fn(*args), _local.spans
+    finally:
+        _local.spans = None
+
+
+def add_spans(spans: Dict[str, float]) -> None:
+    """Add span totals collected on another thread to this thread's request
+    (totals of work run in parallel can exceed the request's wall time)."""
+    own = getattr(_local, 'spans', None)
+    if own is not None:
+        for name, elapsed in spans.items():
+            own[name] = own.get(name, 0.0) + elapsed
+
+
+def start_request() -> None:
+    _local.spans = {}
+    _local.start = time.perf_counter()
+
+
+def finish_request(method: str, route: str, status: int) -> Optional[Tuple[float, Dict[str, float]]]:
+    """Record the request started with `start_request` on this thread and
+    return (duration in seconds, span totals), or None if none was started."""
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        return None
+    duration = time.perf_counter() - _local.start
+    _local.spans = None
+    registry.observe(
+        'blog_request_duration_seconds',
+        (('method', method), ('route', route), ('status', str(status))),
+        duration,
+    )
+    return duration, spans
+
+
+def server_timing(duration: float, spans: Dict[str, float]) -> str:
+    """Server-Timing header value: one entry per span plus the total, in ms."""
+    parts = [f"{name};dur={secs * 1000:.2f}" for name, secs in sorted(spans.items(), key=lambda s: -s[1])]
+    parts.append(f"total;dur={duration * 1000:.2f}")
+    return ', '.join(parts)
+
+
+def render() -> str:
+    return registry.render()
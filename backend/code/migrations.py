@@ -0,0 +1,145 @@
+"""Versioned schema migrations for the SQLite databases.
+
+Every database records the migrations applied to it in a `schema_version`
+table. The module that owns a database registers it with `database()` and
+its migrations, in order, with `@migration(<name>, <version>, <description>)`.
+`migrate()` applies whatever is pending, each migration in its own
+transaction; run it at deploy time with `flask --app app migrate`.
+`ensure_current()` checks the versions once per process (one SELECT per
+database), so serving requests never probes or alters the schema.
+
+Version 1 of each database uses IF NOT EXISTS and column checks, so it also
+adopts databases created before migrations existed.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from db_pool import begin_write
+
+logger = logging.getLogger(__name__)
+
+# Apply pending migrations on startup (app.init_db) instead of refusing to
+# start; turn off when `flask --app app migrate` runs as a release step
+MIGRATE_ON_START = os.environ.get("MIGRATE_ON_START", "1").strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+class SchemaOutdated(RuntimeError):
+    """Migrations are pending and MIGRATE_ON_START is off."""
+
+
+# name -> (connection factory, migrations in version order), in registration
+# order (a database registered later may depend on an earlier one)
+_databases: Dict[str, Tuple[Callable, List[Migration]]] = {}
+_checked = False
+_lock = threading.Lock()
+
+
+def database(name: str, connect: Callable) -> None:
+    """Register a database; `connect()` must return a pooled connection
+    context manager (the owning module's _get_conn)."""
+    _databases.setdefault(name, (connect, []))
+
+
+def migration(name: str, version: int, description: str):
+    """Register the function applying `version` of database `name`. Versions
+    must be registered in order, starting at 1."""
+    def register(fn: Callable[[sqlite3.Connection], None]) -> Callable[[sqlite3.Connection], None]:
+        steps = _databases[name][1]
+        if version != len(steps) + 1:
+            raise ValueError(f"Migration {name} v{version} registered out of order (expected v{len(steps) + 1})")
+        steps.append(Migration(version, description, fn))
+        return fn
+    return register
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    """ALTER TABLE ADD COLUMN unless the column exists (databases adopted by
+    a baseline migration may already have it)."""
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info('{table}')")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _current_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0  # no schema_version table yet
+    return row[0] or 0
+
+
+def status() -> Dict[str, Dict[str, object]]:
+    """Applied and latest version of every registered database."""
+    result = {}
+    for name, (connect, steps) in _databases.items():
+        with connect() as conn:
+            current = _current_version(conn)
+        result[name] = {'version': current, 'latest': len(steps),
+                        'pending': [f"v{m.version} {m.description}" for m in steps if m.version > current]}
+    return result
+
+
+def pending() -> List[str]:
+    return [f"{name} {step}" for name, info in status().items() for step in info['pending']]
+
+
+def migrate() -> List[str]:
+    """Apply every pending migration; returns what was applied. Safe to run
+    from several processes at once: each step re-reads the version under
+    the write lock and skips what another process already applied."""
+    applied = []
+    for name, (connect, steps) in _databases.items():
+        with connect() as conn:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at REAL NOT NULL
+                )
+                '''
+            )
+        for step in steps:
+            with connect() as conn:
+                # Locks this database only (BEGIN IMMEDIATE would also lock
+                # attached ones, e.g. users.db under posts.db)
+                begin_write(conn, 'schema_version')
+                if step.version <= _current_version(conn):
+                    continue
+                start = time.perf_counter()
+                step.apply(conn)
+                conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                             (step.version, step.description, time.time()))
+            logger.info("Applied migration %s v%d (%s) in %.1f ms", name, step.version, step.description,
+                        (time.perf_counter() - start) * 1000)
+            applied.append(f"{name} v{step.version} {step.description}")
+    return applied
+
+
+def ensure_current(auto_migrate: bool = MIGRATE_ON_START) -> None:
+    """Make sure every registered database is at its latest version; checked
+    once per process. Raises SchemaOutdated when migrations are pending and
+    `auto_migrate` is off."""
+    global _checked
+    if _checked:
+        return
+    with _lock:
+        if _checked:
+            return
+        todo = pending()
+        if todo:
+            if not auto_migrate:
+                raise SchemaOutdated("Database schema is out of date, run `flask --app app migrate` "
+                                     "(pending: " + ", ".join(todo) + ")")
+            migrate()
+        _checked = True
@@ -0,0 +1,168 @@
+"""Shared Argon2 password hashing, run off the request thread.
+
+One `PasswordHasher` is configured from the environment and every hash/verify
+runs on a bounded thread pool. At most ARGON2_MAX_CONCURRENCY hashes run at a
+time and at most ARGON2_MAX_QUEUE more may wait; beyond that `HashingBusy` is
+raised at once (and after ARGON2_QUEUE_TIMEOUT seconds of waiting) so the API
+can answer 503 instead of letting a login burst starve every worker.
+
+Both limits are per server process. Unless set, `configure()` derives them
+from the server's shape when a worker starts: the CPU cores are shared among
+the worker processes, and running plus queued hashes stay below the worker's
+request threads, so a burst is rejected while threads are left for other
+requests.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from argon2 import PasswordHasher  # type: ignore
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError  # type: ignore
+
+import metrics
+
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", "4"))
+# Per process; derived from the server's processes and threads when unset
+_MAX_CONCURRENCY_SETTING = os.environ.get("ARGON2_MAX_CONCURRENCY")
+_MAX_QUEUE_SETTING = os.environ.get("ARGON2_MAX_QUEUE")
+ARGON2_QUEUE_TIMEOUT = float(os.environ.get("ARGON2_QUEUE_TIMEOUT", "5"))
+
+T = TypeVar("T")
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are queued; the caller should retry later."""
+
+    retry_after = 1
+
+
+hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
+
+ARGON2_MAX_CONCURRENCY = 0
+ARGON2_MAX_QUEUE = 0
+_executor: Optional[ThreadPoolExecutor] = None
+# Slots for running + queued hashes; admission fails fast once they're gone
+_slots = threading.BoundedSemaphore(1)
+_stats_lock = threading.Lock()
+_stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "timed_out": 0}
+
+
+def default_limits(workers: int, threads: Optional[int]) -> Tuple[int, int]:
+    """(max concurrency, max queue) for one of `workers` server processes
+    with `threads` request threads each (None: not bounded, e.g. the
+    development server)."""
+    cores = os.cpu_count() or 2
+    concurrency = max(1, cores // max(1, workers))
+    if threads is None:
+        return concurrency, 4 * concurrency
+    # Keep at least one request thread free of hashing
+    concurrency = max(1, min(concurrency, threads - 1))
+    return concurrency, max(0, threads - 1 - concurrency)
+
+
+def configure(workers: int = 1, threads: Optional[int] = None) -> None:
+    """Size this process's hashing limits for a server with `workers`
+    processes of `threads` request threads each; ARGON2_MAX_CONCURRENCY and
+    ARGON2_MAX_QUEUE override the derived values. Call before serving."""
+    global ARGON2_MAX_CONCURRENCY, ARGON2_MAX_QUEUE, _executor, _slots
+    concurrency, queue = default_limits(workers, threads)
+    if _MAX_CONCURRENCY_SETTING:
+        concurrency = int(_MAX_CONCURRENCY_SETTING)
+    if _MAX_QUEUE_SETTING:
+        queue = int(_MAX_QUEUE_SETTING)
+    old = _executor
+    ARGON2_MAX_CONCURRENCY, ARGON2_MAX_QUEUE = concurrency, queue
+    _executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="argon2")
+    _slots = threading.BoundedSemaphore(concurrency + queue)
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+configure()
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _run(fn: Callable[..., T], *args) -> T:
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        _count("rejected")
+        raise HashingBusy("Password hashing queue is full")
+    try:
+        future = _executor.submit(fn, *args)
+        try:
+            return future.result(timeout=ARGON2_QUEUE_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            _count("timed_out")
+            raise HashingBusy("Timed out waiting for password hashing")
+    finally:
+        slots.release()
+
+
+@metrics.timed('argon2.hash')
+def hash_password(password: str) -> str:
+    digest = _run(hasher.hash, password)
+    _count("hashed")
+    return digest
+
+
+@metrics.timed('argon2.verify')
+def verify_password(hashed: str, password: str) -> bool:
+    """True when `password` matches `hashed`; False on mismatch or a bad hash."""
+    def _verify() -> bool:
+        try:
+            return hasher.verify(hashed, password)
+        except (VerifyMismatchError, VerificationError, InvalidHashError):
+            return False
+    ok = _run(_verify)
+    _count("verified")
+    return ok
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when `hashed` was made with other parameters than the current ones."""
+    try:
+        return hasher.check_needs_rehash(hashed)
+    except InvalidHashError:
+        return True
+
+
+def verify_and_upgrade(hashed: str, password: str) -> Tuple[bool, Optional[str]]:
+    """Verify `password`; when it matches but `hashed` uses outdated
+    parameters, also return a fresh hash for the caller to store."""
+    if not verify_password(hashed, password):
+        return False, None
+    if not needs_rehash(hashed):
+        return True, None
+    try:
+        new_hash = hash_password(password)
+    except HashingBusy:
+        # Upgrading is opportunistic; it will happen on a later login
+        return True, None
+    _count("rehashed")
+    return True, new_hash
+
+
+def hasher_stats() -> Dict[str, object]:
+    with _stats_lock:
+        stats: Dict[str, object] = dict(_stats)
+    stats.update(
+        time_cost=ARGON2_TIME_COST,
+        memory_cost=ARGON2_MEMORY_COST,
+        parallelism=ARGON2_PARALLELISM,
+        max_concurrency=ARGON2_MAX_CONCURRENCY,
+        max_queue=ARGON2_MAX_QUEUE,
+    )
+    return stats
+
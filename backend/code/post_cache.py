@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Set, Tuple
+
+POST_CACHE_MAX_ENTRIES = int(os.environ.get("POST_CACHE_MAX_ENTRIES", "512"))
+POST_CACHE_MAX_BYTES = int(os.environ.get("POST_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+POST_CACHE_TTL_SECONDS = float(os.environ.get("POST_CACHE_TTL_SECONDS", "60"))
+
+
+def _file_signature(paths: Iterable[str]) -> Tuple[Tuple[str, Optional[int]], ...]:
+    sig = []
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        sig.append((path, mtime))
+    return tuple(sig)
+
+
+class LRUCache:
+    """Bounded, size-aware LRU of serialized responses, grouped by post id.
+
+    Each entry remembers the mtimes of the files it was built from; a hit whose
+    files changed on disk counts as a miss. Entries also expire after `ttl`
+    seconds, which bounds staleness for writes made by other worker processes
+    (explicit invalidation only reaches the current process).
+    """
+
+    def __init__(self, max_entries: int = POST_CACHE_MAX_ENTRIES,
+                 max_bytes: int = POST_CACHE_MAX_BYTES,
+                 ttl: float = POST_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, Hashable], tuple]" = OrderedDict()
+        self._by_post: Dict[int, Set[Tuple[int, Hashable]]] = {}
+        self._generations: Dict[int, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def _drop(self, key) -> None:
+        _, _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+        keys = self._by_post.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_post[key[0]]
+
+    def get(self, post_id: int, variant: Hashable = None) -> Optional[bytes]:
+        key = (post_id, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, signature, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+        # stat() outside the lock; a changed file means the entry is stale
+        if _file_signature(p for p, _ in signature) != signature:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        return value
+
+    def generation(self, post_id: int) -> int:
+        """Invalidation counter for `post_id`; read it before loading the post."""
+        with self._lock:
+            return self._generations.get(post_id, 0)
+
+    def put(self, post_id: int, variant: Hashable, value: bytes, files: Iterable[str] = (),
+            generation: Optional[int] = None) -> None:
+        """Store `value`. When `generation` is given and the post was invalidated
+        since it was read, the (possibly stale) value is discarded."""
+        if self.max_entries <= 0 or len(value) > self.max_bytes:
+            return
+        key = (post_id, variant)
+        entry = (time.monotonic() + self.ttl, _file_signature(files), value)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(post_id, 0):
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._by_post.setdefault(post_id, set()).add(key)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, post_id: int) -> None:
+        """Drop every cached variant of `post_id` (write-through invalidation)."""
+        with self._lock:
+            for key in list(self._by_post.get(post_id, ())):
+                self._drop(key)
+            self._generations[post_id] = self._generations.get(post_id, 0) + 1
+            self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_post.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes,
+                        max_entries=self.max_entries, max_bytes=self.max_bytes)
+
+
+# Process-wide cache of assembled GET /api/posts/<id> responses
+post_cache = LRUCache()
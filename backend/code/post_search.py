@@ -0,0 +1,112 @@
+"""Full-text search over posts with an SQLite FTS5 index.
+
+`posts_fts` holds the title, author and markdown-stripped body of each post,
+keyed by the post id (its rowid). db_logic_posts keeps it in sync inside the
+same transaction that writes the post row.
+"""
+import html
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+from mdx_text import strip_markdown
+
+# bm25 column weights: title, author, body
+RANK_WEIGHTS = (10.0, 2.0, 1.0)
+SNIPPET_TOKENS = 24
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+# What FTS5 wraps matches in: control characters that html.escape leaves
+# alone, removed from the text when it is indexed (see _clean)
+_MARK_OPEN = '\x02'
+_MARK_CLOSE = '\x03'
+_MARKS = str.maketrans('', '', _MARK_OPEN + _MARK_CLOSE)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _clean(text: Optional[str]) -> str:
+    return (text or '').translate(_MARKS)
+
+
+def create_search_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            title, author, body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        '''
+    )
+
+
+def index_post(conn: sqlite3.Connection, post_id: int, title: str,
+               author: Optional[str], mdx: Optional[str]) -> None:
+    conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (post_id,))
+    conn.execute(
+        'INSERT INTO posts_fts (rowid, title, author, body) VALUES (?, ?, ?, ?)',
+        (post_id, _clean(title), _clean(author), _clean(strip_markdown(mdx))),
+    )
+
+
+def index_posts(conn: sqlite3.Connection,
+                rows: Iterable[Tuple[int, str, Optional[str], Optional[str]]]) -> None:
+    """Index new posts in one statement; rows are (id, title, author, mdx)."""
+    conn.executemany(
+        'INSERT INTO posts_fts (rowid, title, author, body) VALUES (?, ?, ?, ?)',
+        ((pid, _clean(title), _clean(author), _clean(strip_markdown(mdx))) for pid, title, author, mdx in rows),
+    )
+
+
+def set_author(conn: sqlite3.Connection, post_id: int, author: Optional[str]) -> None:
+    conn.execute('UPDATE posts_fts SET author = ? WHERE rowid = ?', (_clean(author), post_id))
+
+
+def unindex_post(conn: sqlite3.Connection, post_id: int) -> None:
+    conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (post_id,))
+
+
+def clear_index(conn: sqlite3.Connection) -> None:
+    conn.execute('DELETE FROM posts_fts')
+
+
+def to_match_query(text: str) -> Optional[str]:
+    """Turn free user input into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS operators and punctuation in the input can't
+    cause syntax errors) and the last one is a prefix match, which suits
+    search-as-you-type. Returns None when the input has no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return None
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _highlight_html(text: Optional[str]) -> str:
+    """HTML-escape indexed text, keeping only the match markers as tags."""
+    escaped = html.escape(text or '')
+    return escaped.replace(_MARK_OPEN, HIGHLIGHT_OPEN).replace(_MARK_CLOSE, HIGHLIGHT_CLOSE)
+
+
+def search(conn: sqlite3.Connection, match: str, limit: int, offset: int = 0) -> List[tuple]:
+    """Ranked matches as (post_id, highlighted_title, snippet, rank) tuples.
+    Title and snippet are HTML: the text is escaped and matches are wrapped
+    in HIGHLIGHT_OPEN/HIGHLIGHT_CLOSE."""
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    rows = conn.execute(
+        f'''
+        SELECT rowid,
+               highlight(posts_fts, 0, ?, ?),
+               snippet(posts_fts, 2, ?, ?, '…', {SNIPPET_TOKENS}),
+               bm25(posts_fts, {weights}) AS rank
+        FROM posts_fts
+        WHERE posts_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        ''',
+        (_MARK_OPEN, _MARK_CLOSE, _MARK_OPEN, _MARK_CLOSE, match, limit, offset),
+    ).fetchall()
+    return [(pid, _highlight_html(title), _highlight_html(snippet), rank) for pid, title, snippet, rank in rows]
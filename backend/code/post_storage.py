@@ -0,0 +1,200 @@
+"""Pluggable storage for post bodies and thumbnails.
+
+Posts keep a *ref* in their `content`/`thumbnail` columns. Two backends exist:
+
+- ``fs`` (default): loose files under ``posts/``; the ref is the file path
+  relative to the code directory (``../posts/<uuid>.mdx``), as it always was.
+- ``db``: a content-addressed blob table inside ``posts.db``; the ref is
+  ``blob:<sha256><ext>``. Identical payloads are stored once and reference
+  counted, and blob writes share the transaction of the post row.
+
+New posts go to the backend selected by ``POST_STORAGE``; reads dispatch on the
+ref itself, so both kinds can coexist while migrating.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import uuid
+from typing import Optional
+
+import metrics
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+POSTS_DIR = os.path.abspath(os.environ.get("POSTS_DIR") or os.path.join(CODE_DIR, '..', 'posts'))
+POST_STORAGE = os.environ.get("POST_STORAGE", "fs").strip().lower()
+
+BLOB_PREFIX = 'blob:'
+BLOB_MEDIA_NAME_RE = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+logger = logging.getLogger(__name__)
+
+
+def create_blobs_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+        '''
+    )
+
+
+class FilesystemStorage:
+    name = 'fs'
+    # put() does not touch the connection, so it may run on worker threads
+    concurrent_writes = True
+
+    @metrics.timed('io.write')
+    def put(self, conn: sqlite3.Connection, data: bytes, ext: str) -> str:
+        os.makedirs(POSTS_DIR, exist_ok=True)
+        path = os.path.join(POSTS_DIR, f"{uuid.uuid4()}{ext}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        # store paths relative to the code directory so they are portable
+        return os.path.relpath(path, CODE_DIR)
+
+    def get(self, ref: str) -> Optional[bytes]:
+        try:
+            with open(self.local_path(ref), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.local_path(ref))
+
+    def local_path(self, ref: str) -> str:
+        return os.path.join(CODE_DIR, ref)
+
+    def media_name(self, ref: str) -> str:
+        return os.path.basename(ref)
+
+    def release(self, conn: sqlite3.Connection, ref: str) -> None:
+        # Files are removed by purge() once the transaction has committed
+        pass
+
+    def purge(self, ref: str) -> None:
+        try:
+            os.remove(self.local_path(ref))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.warning("Could not remove post file %s", ref, exc_info=True)
+
+
+class DatabaseStorage:
+    name = 'db'
+    concurrent_writes = False
+
+    @staticmethod
+    def _split(ref: str):
+        name = ref[len(BLOB_PREFIX):]
+        return name[:64], name[64:]
+
+    def put(self, conn: sqlite3.Connection, data: bytes, ext: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        conn.execute(
+            'INSERT INTO blobs (hash, data, size, refcount) VALUES (?, ?, ?, 1) '
+            'ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1',
+            (digest, sqlite3.Binary(data), len(data)),
+        )
+        return f"{BLOB_PREFIX}{digest}{ext}"
+
+    def get(self, ref: str) -> Optional[bytes]:
+        return get_blob(self._split(ref)[0])
+
+    def exists(self, ref: str) -> bool:
+        return blob_exists(self._split(ref)[0])
+
+    def local_path(self, ref: str) -> Optional[str]:
+        return None
+
+    def media_name(self, ref: str) -> str:
+        digest, ext = self._split(ref)
+        return f"{digest}{ext}"
+
+    def release(self, conn: sqlite3.Connection, ref: str) -> None:
+        digest = self._split(ref)[0]
+        conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?', (digest,))
+        conn.execute('DELETE FROM blobs WHERE hash = ? AND refcount <= 0', (digest,))
+
+    def purge(self, ref: str) -> None:
+        pass
+
+
+_BACKENDS = {'fs': FilesystemStorage(), 'db': DatabaseStorage()}
+
+
+def get_storage(name: Optional[str] = None):
+    """Backend used for new writes (``POST_STORAGE`` unless `name` is given)."""
+    name = (name or POST_STORAGE)
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown post storage backend: {name!r} (expected 'fs' or 'db')")
+    return _BACKENDS[name]
+
+
+def storage_for_ref(ref: str):
+    return _BACKENDS['db'] if ref.startswith(BLOB_PREFIX) else _BACKENDS['fs']
+
+
+def get_blob(digest: str) -> Optional[bytes]:
+    # Lazy import: db_logic_posts imports this module
+    from db_logic_posts import _get_conn
+    with _get_conn() as conn:
+        row = conn.execute('SELECT data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+    return bytes(row[0]) if row else None
+
+
+def blob_exists(digest: str) -> bool:
+    """Like get_blob() is not None, without reading the data."""
+    from db_logic_posts import _get_conn
+    with _get_conn() as conn:
+        return conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone() is not None
+
+
+@metrics.timed('io.read')
+def read_bytes(ref: Optional[str]) -> Optional[bytes]:
+    if not ref:
+        return None
+    return storage_for_ref(ref).get(ref)
+
+
+def read_text(ref: Optional[str]) -> Optional[str]:
+    data = read_bytes(ref)
+    if data is None:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def exists(ref: Optional[str]) -> bool:
+    return bool(ref) and storage_for_ref(ref).exists(ref)
+
+
+def local_path(ref: Optional[str]) -> Optional[str]:
+    """Filesystem path backing `ref`, or None for DB-stored payloads."""
+    if not ref:
+        return None
+    return storage_for_ref(ref).local_path(ref)
+
+
+def media_name(ref: str) -> str:
+    """File name under /media/posts/ that serves `ref`."""
+    return storage_for_ref(ref).media_name(ref)
+
+
+def release(conn: sqlite3.Connection, ref: Optional[str]) -> None:
+    if ref:
+        storage_for_ref(ref).release(conn, ref)
+
+
+def purge(ref: Optional[str]) -> None:
+    if ref:
+        storage_for_ref(ref).purge(ref)
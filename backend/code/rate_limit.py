@@ -0,0 +1,251 @@
+"""Token-bucket rate limiting for abuse-prone routes.
+
+A `Policy` gives a route a bucket per client IP and, optionally, one per
+identity (the email being logged into, the token's user id). Buckets hold
+up to N tokens and refill continuously at N per period; a request takes one
+token or is refused with `RateLimited`, which the API turns into a 429 with
+``Retry-After``.
+
+Buckets live in process memory by default. With several gunicorn workers
+each worker then enforces the limit on its own, so the effective limit is
+multiplied by the worker count; RATE_LIMIT_STORE=sqlite shares the buckets
+through ``db/ratelimit.db`` instead (one small write per limited request).
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import metrics
+from db_pool import get_pool
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1").strip().lower() in ('1', 'true', 'yes', 'on')
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory").strip().lower()
+# Buckets kept by the memory store; the least recently used are dropped
+# (a dropped bucket starts full again)
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+DB_DIR = os.environ.get("DB_DIR") or os.path.join(os.path.dirname(__file__), '..', 'db')
+DB_PATH = os.path.abspath(os.path.join(DB_DIR, 'ratelimit.db'))
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour|day)s?\s*$')
+
+
+class RateLimited(Exception):
+    """A bucket is empty; the client may retry after `retry_after` seconds."""
+
+    def __init__(self, policy: str, retry_after: int):
+        super().__init__(f"Rate limit '{policy}' exceeded")
+        self.policy = policy
+        self.retry_after = retry_after
+
+
+class Limit:
+    """`capacity` requests per `period` seconds, e.g. Limit.parse("5/minute")."""
+
+    __slots__ = ('capacity', 'period')
+
+    def __init__(self, capacity: int, period: float):
+        if capacity <= 0 or period <= 0:
+            raise ValueError("Rate limits need a positive count and period")
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Limit':
+        match = _LIMIT_RE.match(spec or '')
+        if not match:
+            raise ValueError(f"Invalid rate limit '{spec}' (expected e.g. '10/minute')")
+        return cls(int(match.group(1)), _PERIODS[match.group(2)])
+
+    def __repr__(self) -> str:
+        return f"Limit({self.capacity}/{self.period:g}s)"
+
+
+def _limit_from_env(name: str, default: Optional[str]) -> Optional[Limit]:
+    # An empty override switches that bucket off
+    spec = os.environ.get(name, default)
+    return Limit.parse(spec) if spec and spec.strip() else None
+
+
+class Policy:
+    """Named limits for a route. Defaults can be overridden with
+    RATE_LIMIT_<NAME>_IP / RATE_LIMIT_<NAME>_IDENTITY (empty = off)."""
+
+    def __init__(self, name: str, per_ip: Optional[str] = None, per_identity: Optional[str] = None):
+        env = 'RATE_LIMIT_' + re.sub(r'\W', '_', name).upper()
+        self.name = name
+        self.per_ip = _limit_from_env(env + '_IP', per_ip)
+        self.per_identity = _limit_from_env(env + '_IDENTITY', per_identity)
+
+    def __repr__(self) -> str:
+        return f"Policy({self.name!r}, ip={self.per_ip}, identity={self.per_identity})"
+
+
+class MemoryStore:
+    """Buckets in a bounded, process-local LRU."""
+
+    name = 'memory'
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Take `cost` tokens from `key`'s bucket. Returns 0 when allowed,
+        else the seconds until enough tokens are back."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(limit.capacity), now))
+            tokens = min(float(limit.capacity), tokens + (now - updated) * limit.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteStore:
+    """Buckets in an SQLite table shared by every process on the host.
+
+    Each take is one UPSERT: refill, the decision and the new token count are
+    computed in SQL from the row's old values, so concurrent workers can't
+    both spend the last token. Rows of buckets that have refilled completely
+    are indistinguishable from missing ones and are purged now and then.
+    """
+
+    name = 'sqlite'
+    PURGE_EVERY = 1000
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._takes = 0
+        self._ready = False
+
+    def _get_conn(self):
+        return get_pool(self.db_path).connection()
+
+    def _create_table(self) -> None:
+        with self._get_conn() as conn:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    full_at REAL NOT NULL,
+                    wait REAL NOT NULL
+                ) WITHOUT ROWID
+                '''
+            )
+        self._ready = True
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        if not self._ready:
+            self._create_table()
+        now = time.time()
+        params = {'key': key, 'now': now, 'cap': float(limit.capacity), 'rate': limit.rate, 'cost': cost}
+        refilled = 'MIN(:cap, tokens + (:now - updated_at) * :rate)'
+        with self._get_conn() as conn:
+            row = conn.execute(
+                f'''
+                INSERT INTO rate_limits (key, tokens, updated_at, full_at, wait)
+                VALUES (:key, :cap - :cost, :now, :now + :cost / :rate, 0)
+                ON CONFLICT(key) DO UPDATE SET
+                    tokens = CASE WHEN {refilled} >= :cost THEN {refilled} - :cost ELSE {refilled} END,
+                    wait = CASE WHEN {refilled} >= :cost THEN 0 ELSE (:cost - {refilled}) / :rate END,
+                    full_at = :now + (:cap - CASE WHEN {refilled} >= :cost THEN {refilled} - :cost
+                                                  ELSE {refilled} END) / :rate,
+                    updated_at = :now
+                RETURNING wait
+                ''',
+                params,
+            ).fetchone()
+            self._takes += 1
+            if self._takes % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM rate_limits WHERE full_at < ?', (now,))
+        return row[0]
+
+    def clear(self) -> None:
+        if self._ready:
+            with self._get_conn() as conn:
+                conn.execute('DELETE FROM rate_limits')
+
+    def size(self) -> int:
+        if not self._ready:
+            return 0
+        with self._get_conn() as conn:
+            return conn.execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+
+
+class RateLimiter:
+    def __init__(self, store=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.store = store if store is not None else make_store(RATE_LIMIT_STORE)
+        self.enabled = enabled
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, policy: str, outcome: str) -> None:
+        with self._stats_lock:
+            counts = self._stats.setdefault(policy, {'allowed': 0, 'limited': 0})
+            counts[outcome] += 1
+        metrics.inc('blog_rate_limit_requests_total', policy=policy, outcome=outcome)
+
+    def check(self, policy: Policy, ip: Optional[str], identity: Optional[str] = None) -> None:
+        """Spend a token from each of the policy's buckets for this client;
+        raises RateLimited as soon as one of them is empty."""
+        if not self.enabled:
+            return
+        buckets = []
+        if policy.per_ip is not None and ip:
+            buckets.append((f"{policy.name}:ip:{ip}", policy.per_ip))
+        if policy.per_identity is not None and identity:
+            buckets.append((f"{policy.name}:id:{identity}", policy.per_identity))
+        for key, limit in buckets:
+            wait = self.store.take(key, limit)
+            if wait > 0:
+                self._count(policy.name, 'limited')
+                raise RateLimited(policy.name, max(1, math.ceil(wait)))
+        self._count(policy.name, 'allowed')
+
+    def reset(self) -> None:
+        self.store.clear()
+        with self._stats_lock:
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            policies = {name: dict(counts) for name, counts in self._stats.items()}
+        return {'enabled': self.enabled, 'store': self.store.name, 'buckets': self.store.size(),
+                'policies': policies}
+
+
+def make_store(kind: str):
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'sqlite':
+        return SQLiteStore()
+    raise ValueError(f"Unknown RATE_LIMIT_STORE '{kind}' (expected 'memory' or 'sqlite')")
+
+
+# Process-wide limiter used by app.py
+limiter = RateLimiter()
@@ -0,0 +1,48 @@
+"""Shared test setup: a scratch DB_DIR/POSTS_DIR for the whole session.
+
+The app modules read their paths from the environment when imported, so this
+runs before any test module imports them.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCRATCH = tempfile.mkdtemp(prefix='blog-tests-')
+
+os.environ['DB_DIR'] = os.path.join(SCRATCH, 'db')
+os.environ['POSTS_DIR'] = os.path.join(SCRATCH, 'posts')
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+os.makedirs(os.environ['DB_DIR'], exist_ok=True)
+sys.path.insert(0, CODE_DIR)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.init_db()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def make_post(app_module):
+    """Create a post straight through db_logic_posts; returns its id."""
+    import db_logic_posts
+
+    def make(title='A post', mdx='Some *body* text.', **extra):
+        content = {'mdx': mdx, 'thumbnail_bytes': b'\x89PNG\r\n\x1a\n', 'thumbnail_ext': '.png', **extra}
+        return db_logic_posts.create_post(title, content)
+    return make
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
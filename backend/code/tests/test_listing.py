@@ -0,0 +1,41 @@
+"""GET /api/posts: listings built on several POST_IO_CONCURRENCY chunks."""
+import time
+
+import pytest
+
+IO_CONCURRENCY = 4
+
+
+@pytest.fixture(scope='module')
+def post_ids(app_module):
+    import db_logic_posts
+    # More rows than chunks, so several chunks (and threads) build the posts
+    count = IO_CONCURRENCY * 4 + 7
+    return db_logic_posts.create_posts_bulk([
+        {'title': f'chunked {i}', 'mdx': f'Body of post {i}.', 'thumbnail_bytes': b'\x89PNG\r\n\x1a\n',
+         'thumbnail_ext': '.png'}
+        for i in range(count)
+    ])
+
+
+@pytest.fixture
+def slow_chunks(app_module, monkeypatch):
+    """Chunks that take a while, like on a cold volume, so they overlap."""
+    build_chunk = app_module._build_chunk
+
+    def slow(build, rows):
+        time.sleep(0.02)
+        return build_chunk(build, rows)
+    monkeypatch.setattr(app_module, 'POST_IO_CONCURRENCY', IO_CONCURRENCY)
+    monkeypatch.setattr(app_module, '_build_chunk', slow)
+
+
+@pytest.mark.parametrize('query', ['', '?view=summary', '?stream=1'])
+def test_listing_builds_every_post(client, post_ids, slow_chunks, query):
+    resp = client.get('/api/posts' + query)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    posts = body if isinstance(body, list) else body['posts']
+    by_id = {post['id']: post for post in posts}
+    assert set(post_ids) <= set(by_id)
+    assert all(by_id[pid]['title'] == f'chunked {i}' for i, pid in enumerate(post_ids))
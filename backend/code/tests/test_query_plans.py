@@ -0,0 +1,75 @@
+"""Feed queries must be answered from indexes.
+
+Runs EXPLAIN QUERY PLAN for every shape of feed page (plain, cursor, author,
+linked user, date range and their combinations) on copies of freshly
+migrated databases holding some posts and ANALYZE statistics, and fails when
+a plan contains a full table scan (of posts or the joined users) or a
+temporary B-tree for ORDER BY.
+"""
+import itertools
+import sqlite3
+
+import pytest
+
+import db_logic_posts
+import migrations
+
+POSTS = 2000
+CURSOR = ('2024-03-01T00:00:00.000+00:00', 1000)
+OPTIONS = {
+    'after': (None, CURSOR),
+    'author': (None, 'author7'),
+    'author_id': (None, 7),
+    'since': (None, '2024-02-01T00:00:00.000+00:00'),
+    'until': (None, '2024-06-01T00:00:00.000+00:00'),
+}
+SHAPES = [
+    {k: v for k, v in zip(OPTIONS, values) if v is not None}
+    for values in itertools.product(*OPTIONS.values())
+]
+
+
+def bad_plan_lines(plan):
+    """Plan details that mean a full scan or an extra sort."""
+    bad = []
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            bad.append(detail)
+        if 'TEMP B-TREE' in detail:
+            bad.append(detail)
+    return bad
+
+
+@pytest.fixture(scope='module')
+def planner_conn(tmp_path_factory):
+    migrations.migrate()
+    scratch = tmp_path_factory.mktemp('plans')
+    posts_path, users_path = str(scratch / 'posts.db'), str(scratch / 'users.db')
+    # Copies, so the rows below don't leak into other tests' databases
+    for source, target in ((db_logic_posts.DB_PATH, posts_path), (db_logic_posts.USERS_DB_PATH, users_path)):
+        src = sqlite3.connect(source)
+        src.execute('VACUUM INTO ?', (target,))
+        src.close()
+    conn = sqlite3.connect(posts_path)
+    conn.execute('ATTACH DATABASE ? AS users', (users_path,))
+    # Rows only (no files): the planner just needs a realistic table
+    conn.executemany(
+        'INSERT INTO posts (thumbnail, title, content, author, author_id, created_at, updated_at, change_seq) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [('t', f'post {i}', 'c', f'author{i % 50}', i % 50 or None,
+          f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00.000+00:00', '', i + 1)
+         for i in range(POSTS)],
+    )
+    conn.executemany('INSERT INTO users.users (name, email, password) VALUES (?, ?, ?)',
+                     [(f'author{i}', f'author{i}@example.com', 'x') for i in range(1, 50)])
+    conn.execute('ANALYZE')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('kwargs', SHAPES, ids=lambda kwargs: '+'.join(sorted(kwargs)) or 'plain')
+def test_feed_query_uses_indexes(planner_conn, kwargs):
+    query, params = db_logic_posts._feed_query(20, **kwargs)
+    plan = [row[3] for row in planner_conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+    assert not bad_plan_lines(plan), '; '.join(plan)
@@ -0,0 +1,37 @@
+"""GET /api/posts/search: highlighted titles and snippets are safe HTML."""
+import re
+
+import pytest
+
+TITLE = 'Tom & Jerry <img src=x onerror=alert(1)> zebrafish'
+BODY = 'Feeding zebrafish <img src=x onerror="alert(1)"> & friends. <b>bold</b> & <script>x()</script> zebrafish'
+
+
+def without_marks(html):
+    return html.replace('<mark>', '').replace('</mark>', '')
+
+
+@pytest.fixture(scope='module')
+def hit(app_module):
+    import db_logic_posts
+    post_id = db_logic_posts.create_post(TITLE, {
+        'mdx': BODY, 'thumbnail_bytes': b'\x89PNG\r\n\x1a\n', 'thumbnail_ext': '.png',
+    })
+    resp = app_module.app.test_client().get('/api/posts/search?q=zebrafish')
+    assert resp.status_code == 200
+    hits = [p for p in resp.get_json()['posts'] if p['id'] == post_id]
+    assert len(hits) == 1
+    return hits[0]
+
+
+@pytest.mark.parametrize('field', ['title_highlighted', 'snippet'])
+def test_search_html_is_escaped(hit, field):
+    html = hit[field]
+    assert '<mark>zebrafish</mark>' in html
+    # <mark> is the only markup; everything else from the post is text
+    assert not re.search(r'[<>]', without_marks(html)), html
+    assert not re.search(r'&(?!amp;|lt;|gt;|quot;|#x27;|#39;)', html), html
+
+
+def test_search_title_keeps_escaped_text(hit):
+    assert hit['title_highlighted'].startswith('Tom &amp; Jerry &lt;img src=x onerror=alert(1)&gt; ')
@@ -0,0 +1,43 @@
+"""GET /api/posts/changes: incremental sync and when clients must resync."""
+import db_logic_posts
+
+
+def changes(client, since):
+    return client.get(f'/api/posts/changes?since={since}')
+
+
+def test_changes_since_token(client, make_post):
+    since = db_logic_posts.get_change_seq()
+    post_id = make_post(title='synced')
+    resp = changes(client, since)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert [p['id'] for p in body['posts']] == [post_id]
+    assert int(body['next_since']) == db_logic_posts.get_change_seq()
+    # Up to date: nothing new, same token
+    resp = changes(client, body['next_since'])
+    assert resp.status_code == 200
+    assert resp.get_json()['posts'] == []
+    assert resp.get_json()['next_since'] == body['next_since']
+
+
+def test_changes_before_pruned_tombstones(client, make_post):
+    post_id = make_post()
+    since = db_logic_posts.get_change_seq()
+    db_logic_posts.delete_post(post_id)
+    with db_logic_posts._get_conn() as conn:
+        conn.execute("UPDATE posts SET deleted_at = '2000-01-01T00:00:00.000+00:00' WHERE id = ?", (post_id,))
+    assert db_logic_posts.prune_tombstones(1) >= 1
+    resp = changes(client, since)
+    assert resp.status_code == 410
+    assert resp.get_json()['reset'] is True
+
+
+def test_changes_ahead_of_database(client, make_post):
+    # A token from before a reset or restore: newer than anything here
+    make_post()
+    resp = changes(client, db_logic_posts.get_change_seq() + 50)
+    assert resp.status_code == 410
+    assert resp.get_json()['reset'] is True
+    # Syncing from 0 always works
+    assert changes(client, 0).status_code == 200
@@ -0,0 +1,29 @@
+import pytest
+
+from db_logic_posts import normalize_timestamp
+
+
+@pytest.mark.parametrize('value, expected', [
+    # What the app sends: new Date().toISOString()
+    ('2026-10-18T00:13:12.152Z', '2026-10-18T00:13:12.152+00:00'),
+    ('2026-10-18T00:13:12z', '2026-10-18T00:13:12.000+00:00'),
+    ('2026-10-18T02:13:12.152+02:00', '2026-10-18T00:13:12.152+00:00'),
+    ('2026-10-17T19:13:12-05:00', '2026-10-18T00:13:12.000+00:00'),
+    # Naive values are taken as UTC
+    ('2026-10-18T00:13:12', '2026-10-18T00:13:12.000+00:00'),
+    ('2026-10-18', '2026-10-18T00:00:00.000+00:00'),
+    ('  2026-10-18T00:13:12Z ', '2026-10-18T00:13:12.000+00:00'),
+])
+def test_normalize_timestamp(value, expected):
+    assert normalize_timestamp(value) == expected
+
+
+@pytest.mark.parametrize('value', [None, '', '   '])
+def test_normalize_timestamp_empty(value):
+    assert normalize_timestamp(value) is None
+
+
+@pytest.mark.parametrize('value', ['yesterday', 'Z', '2026-13-01', 1700000000])
+def test_normalize_timestamp_invalid(value):
+    with pytest.raises(ValueError):
+        normalize_timestamp(value)
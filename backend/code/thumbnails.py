@@ -0,0 +1,195 @@
+"""Resized/transcoded thumbnail derivatives and LQIP placeholders.
+
+For every uploaded thumbnail a background worker writes, under
+``posts/derived/<sha256 of the source>/``, one file per configured width in
+WebP (and AVIF when Pillow supports it) and in JPEG (PNG for images with
+transparency) for clients that don't ask for those formats by name, plus
+``manifest.json`` describing them and a tiny base64 placeholder (LQIP, an
+8 px wide PNG of ~200 bytes that db_logic_posts copies into the post row).
+Derivatives are keyed by the source bytes, so they are shared across storage
+backends and duplicate uploads, and generated once.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+import post_storage
+from post_storage import POSTS_DIR
+
+DERIVED_DIR = os.path.join(POSTS_DIR, 'derived')
+THUMBNAIL_WIDTHS = tuple(sorted(int(w) for w in os.environ.get("THUMBNAIL_WIDTHS", "160,320,640").split(',') if w.strip()))
+THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "75"))
+LQIP_WIDTH = 8
+# Preferred order when the client accepts several formats
+_FORMAT_PREFERENCE = (('avif', 'image/avif'), ('webp', 'image/webp'))
+# Formats every client decodes, sent when Accept names neither of the above
+_FALLBACK_FORMATS = {'jpeg': 'image/jpeg', 'png': 'image/png'}
+# Bumped when the set of variants changes; older manifests are rebuilt
+MANIFEST_VERSION = 3
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+_pending: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+_digest_cache: Dict[Tuple[str, int, int], str] = {}
+_digest_lock = threading.Lock()
+
+
+def source_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    """SHA-256 of a source file, memoized by path, mtime and size."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = source_digest(f.read())
+        with _digest_lock:
+            if len(_digest_cache) > 4096:
+                _digest_cache.clear()
+            _digest_cache[key] = digest
+    return digest
+
+
+def _available_formats():
+    from PIL import features  # type: ignore
+    return [fmt for fmt, _ in _FORMAT_PREFERENCE if features.check(fmt)]
+
+
+def _derived_path(digest: str, name: str) -> str:
+    return os.path.join(DERIVED_DIR, digest, name)
+
+
+def load_manifest(digest: str) -> Optional[Dict]:
+    try:
+        with open(_derived_path(digest, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def _write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def generate(data: bytes) -> Optional[Dict]:
+    """Build every derivative of `data` synchronously and return the manifest
+    (None when the bytes are not a decodable image)."""
+    from PIL import Image  # type: ignore  # deferred: Pillow is slow to import
+
+    digest = source_digest(data)
+    manifest = load_manifest(digest)
+    if manifest is not None:
+        return manifest
+    try:
+        img = Image.open(BytesIO(data))
+        img.load()
+    except Exception:
+        logger.info("Thumbnail %s is not a decodable image; no derivatives", digest[:12])
+        return None
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    os.makedirs(os.path.join(DERIVED_DIR, digest), exist_ok=True)
+
+    formats = _available_formats() + ['png' if img.mode == 'RGBA' else 'jpeg']
+    variants = []
+    for width in THUMBNAIL_WIDTHS:
+        if width >= img.width and variants:
+            break  # never upscale; the original covers larger requests
+        w = min(width, img.width)
+        resized = img.resize((w, max(1, round(img.height * w / img.width))), Image.LANCZOS)
+        for fmt in formats:
+            buf = BytesIO()
+            resized.save(buf, format=fmt.upper(), quality=THUMBNAIL_QUALITY)
+            name = f"w{w}.{fmt}"
+            _write(_derived_path(digest, name), buf.getvalue())
+            variants.append({'width': w, 'format': fmt, 'file': name, 'bytes': buf.tell()})
+
+    tiny = img.convert('RGB').resize((LQIP_WIDTH, max(1, round(img.height * LQIP_WIDTH / img.width))))
+    buf = BytesIO()
+    tiny.save(buf, format='PNG', optimize=True)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'width': img.width,
+        'height': img.height,
+        'variants': variants,
+        'lqip': 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii'),
+    }
+    # The manifest is written last: its presence means every variant exists
+    _write(_derived_path(digest, 'manifest.json'), json.dumps(manifest).encode('utf-8'))
+    return manifest
+
+
+def schedule(data: Optional[bytes]) -> Optional[Future]:
+    """Generate derivatives of `data` on the worker pool (deduplicated)."""
+    if not data:
+        return None
+    digest = source_digest(data)
+    if load_manifest(digest) is not None:
+        return None
+    with _pending_lock:
+        future = _pending.get(digest)
+        if future is None:
+            future = _executor.submit(_generate_logged, data)
+            _pending[digest] = future
+            future.add_done_callback(lambda _f, d=digest: _forget(d))
+    return future
+
+
+def _forget(digest: str) -> None:
+    with _pending_lock:
+        _pending.pop(digest, None)
+
+
+def _generate_logged(data: bytes) -> Optional[Dict]:
+    try:
+        return generate(data)
+    except Exception:
+        logger.warning("Thumbnail derivative generation failed", exc_info=True)
+        return None
+
+
+def pick_variant(digest: str, width: int, accept) -> Optional[Tuple[str, str]]:
+    """Path and MIME type of the best derivative for a requested width and an
+    Accept header (werkzeug MIMEAccept), or None to serve the original.
+
+    AVIF and WebP are only sent to clients that list them by name: `*/*` and
+    `image/*` are also sent by clients that can't decode them. Everyone else,
+    including requests without Accept, gets the JPEG/PNG variant."""
+    manifest = load_manifest(digest)
+    if not manifest or not manifest.get('variants'):
+        return None
+    named = {value.lower() for value, quality in accept if quality > 0} if accept else set()
+    choices = [(fmt, mime) for fmt, mime in _FORMAT_PREFERENCE if mime in named]
+    choices += list(_FALLBACK_FORMATS.items())
+    for fmt, mime in choices:
+        candidates = [v for v in manifest['variants'] if v['format'] == fmt]
+        if not candidates:
+            continue
+        # Smallest variant at least as wide as requested; wider requests get
+        # the full-size original
+        fitting = [v for v in candidates if v['width'] >= width]
+        if not fitting:
+            return None
+        chosen = min(fitting, key=lambda v: v['width'])
+        return _derived_path(digest, chosen['file']), mime
+    return None